@@ -9,6 +9,7 @@ from ryu.lib.packet import ethernet
 from ryu.lib.packet import ipv6, ipv4
 from ryu.topology import event
 from ryu.ofproto.ofproto_v1_2 import OFPG_ANY
+from ryu import cfg
 
 from collections import defaultdict
 
@@ -18,8 +19,16 @@ from numpy.random import choice as np_choice
 import random
 import time
 
+import topology
+
 idle_time = 3000
 
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt('topology_file', default=None,
+               help='topology description (topology.py format) giving the delays of the links'),
+])
+
 
 class ProjectController(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
@@ -39,6 +48,10 @@ class ProjectController(app_manager.RyuApp):
         self.datapaths = {}
         self.disable_packet_in = False
         self.pkt_count=0
+        # delay and bandwidth of the links read from the topology file, (s1, s2) with s1 < s2 -> (delay, bw)
+        self.link_table = {}
+        if CONF.topology_file:
+            self.link_table = topology.link_table(topology.load(CONF.topology_file))
         
         
 
@@ -65,27 +78,8 @@ class ProjectController(app_manager.RyuApp):
         return node
 
     def get_link_cost(self, s1, s2): #Link cost between two generic switches s1 and s2
-
-        if (self.switches_count<10): #used to understand how complex the network is 
-            factor = 2 
-        else:
-            factor = 4
-        
-        delay = float(0)
-        value = float((s1+s2)/factor) #index evaluating depending on the scaling factor
-        
-        if(value < 2.5 or value > 6.9):
-            delay = 4
-        elif(value > 4.5 and value <5.5):
-            delay = 4
-        elif(value > 3 and value <4):
-            delay = 10
-        elif(value >5.4 and value <6):
-            delay = 10
-        else:
-            delay= 7
-        
-        return delay #elaborated delay between s1 and s2
+        # the delays come from the same topology description as the Mininet scripts
+        return topology.link_delay(self.link_table, s1, s2) #delay between s1 and s2
         
 
     def get_path_cost(self, path): #total cost of the path 
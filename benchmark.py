@@ -0,0 +1,241 @@
+#Offline benchmark of the dijkstra.py controller: no Mininet and no switch, the
+#datapaths are fake objects which count the messages and answer the barriers.
+#
+#   python benchmark.py                              runs the default suite
+#   python benchmark.py --topology fat-tree --k 8 --flows 2000 --output result.json
+
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+from ryu.controller import ofp_event
+from ryu.controller.handler import MAIN_DISPATCHER
+from ryu.topology import event
+from ryu.topology.switches import Switch, Port, Link
+
+from collections import Counter
+
+import argparse, json, logging, platform, random, socket, struct, sys, time
+
+import dijkstra
+import topology
+from metrics import LatencyHistogram
+
+SUITE = [
+    {'topology': 'fat-tree', 'k': 4, 'flows': 500},
+    {'topology': 'fat-tree', 'k': 8, 'flows': 2000},
+    {'topology': 'leaf-spine', 'leaves': 32, 'spines': 8, 'flows': 2000},
+    {'topology': 'random', 'switches': 100, 'degree': 4, 'flows': 1000},
+    {'topology': 'random', 'switches': 1000, 'degree': 4, 'flows': 1000},
+]
+PERCENTILES = (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))
+
+
+class FakeDatapath(object): #counts the messages sent to it and queues its barrier replies
+
+    def __init__(self, dpid, counts, barriers):
+        self.id = dpid
+        self.ofproto = ofproto_v1_3
+        self.ofproto_parser = ofproto_v1_3_parser
+        self.xid = 0
+        self.is_active = True
+        self.counts = counts #message type -> count, shared by all the datapaths
+        self.barriers = barriers #(datapath, xid) of the barriers to answer, shared too
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        name = msg.__class__.__name__
+        self.counts[name] += 1
+        if name == 'OFPBarrierRequest':
+            self.barriers.append((self, msg.xid))
+
+
+def random_graph(switches, degree, rng): #connected random graph with the given average degree
+    links = set()
+    for s in range(2, switches + 1):
+        p = rng.randint(1, s - 1)
+        links.add((p, s))
+    while len(links) < switches * degree // 2:
+        a, b = rng.sample(range(1, switches + 1), 2)
+        links.add((min(a, b), max(a, b)))
+    return sorted(links), list(range(1, switches + 1))
+
+
+def topology_links(description): #switch links and host switches of a topology.py description
+    links = [(a, b) for a, b, profile in description['links']]
+    return links, sorted(set(host['switch'] for host in description['hosts']))
+
+
+def ip_frame(src_mac, src_ip, dst_mac, dst_ip): #ethernet and IPv4 headers, the fields read by the controller
+    return (bytes.fromhex(dst_mac.replace(':', '')) + bytes.fromhex(src_mac.replace(':', '')) +
+            struct.pack('!HBBHHHBBH4s4s', 0x0800, 0x45, 0, 20, 0, 0, 64, 17, 0,
+                        socket.inet_aton(src_ip), socket.inet_aton(dst_ip)))
+
+
+def host_addresses(i): #MAC and IP of the i-th host
+    return '00:00:%02x:%02x:%02x:%02x' % tuple(struct.pack('!I', i)), socket.inet_ntoa(struct.pack('!I', 0x0a000000 + i))
+
+
+class Benchmark(object):
+
+    def __init__(self, links, edge_switches):
+        self.counts = Counter()
+        self.barriers = []
+        self.ctl = dijkstra.ProjectController()
+        self.links = links
+        self.edge_switches = edge_switches
+        self.datapaths = {}
+        self.hosts = [] #(mac, ip, dpid)
+
+    def packet_in(self, dp, in_port, data):
+        parser = dp.ofproto_parser
+        msg = parser.OFPPacketIn(dp, buffer_id=dp.ofproto.OFP_NO_BUFFER, total_len=len(data), reason=0,
+                                 table_id=0, cookie=0, match=parser.OFPMatch(in_port=in_port), data=data)
+        self.ctl._packet_in_handler(ofp_event.EventOFPPacketIn(msg))
+
+    def answer_barriers(self): #the switches process everything at once and answer
+        while self.barriers:
+            dp, xid = self.barriers.pop()
+            reply = dp.ofproto_parser.OFPBarrierReply(dp)
+            reply.xid = xid
+            self.ctl._barrier_reply_handler(ofp_event.EventOFPBarrierReply(reply))
+
+    def build_topology(self): #switch enter and link add events, one host on port 1 of every edge switch
+        ctl = self.ctl
+        ports = Counter()
+        for a, b in self.links:
+            ports[a] += 1
+            ports[b] += 1
+        dpids = sorted(set(ports))
+        for dpid in dpids:
+            dp = FakeDatapath(dpid, self.counts, self.barriers)
+            self.datapaths[dpid] = dp
+            switch = Switch(dp)
+            for port_no in range(1, ports[dpid] + 2):
+                switch.add_port(ofproto_v1_3_parser.OFPPort(port_no, '00:00:00:00:00:00', b'', 0, 0, 0, 0, 0, 0, 0, 0))
+            ctl._switch_features_handler(ofp_event.EventOFPSwitchFeatures(_Msg(dp)))
+            state = ofp_event.EventOFPStateChange(dp)
+            state.state = MAIN_DISPATCHER
+            ctl._state_change_handler(state)
+            ctl.switch_enter_handler(event.EventSwitchEnter(switch))
+
+        next_port = dict((dpid, 2) for dpid in dpids)
+        for a, b in self.links:
+            pa = Port(a, ofproto_v1_3, ofproto_v1_3_parser.OFPPort(next_port[a], '00:00:00:00:00:00', b'', 0, 0, 0, 0, 0, 0, 0, 0))
+            pb = Port(b, ofproto_v1_3, ofproto_v1_3_parser.OFPPort(next_port[b], '00:00:00:00:00:00', b'', 0, 0, 0, 0, 0, 0, 0, 0))
+            next_port[a] += 1
+            next_port[b] += 1
+            ctl.link_add_handler(event.EventLinkAdd(Link(pa, pb)))
+            ctl.link_add_handler(event.EventLinkAdd(Link(pb, pa)))
+        ctl.update_flood_tree()
+        self.answer_barriers()
+
+    def learn_hosts(self): #every host announces itself with an ARP request
+        for i, dpid in enumerate(self.edge_switches):
+            mac, ip = host_addresses(i + 1)
+            self.hosts.append((mac, ip, dpid))
+            data = dijkstra.build_arp(1, mac, ip, '00:00:00:00:00:00', '10.255.255.254')
+            self.packet_in(self.datapaths[dpid], 1, data)
+
+    def run_flows(self, flows, rng): #first packet of flows between random host pairs
+        latency = LatencyHistogram()
+        self.counts.clear()
+        started = time.perf_counter()
+        for _ in range(flows):
+            (src_mac, src_ip, src), (dst_mac, dst_ip, dst) = rng.sample(self.hosts, 2)
+            start = time.perf_counter_ns()
+            self.packet_in(self.datapaths[src], 1, ip_frame(src_mac, src_ip, dst_mac, dst_ip))
+            self.answer_barriers()
+            latency.record(time.perf_counter_ns() - start)
+        elapsed = time.perf_counter() - started
+        return latency, elapsed
+
+
+class _Msg(object): #switch features message, only its datapath is read
+
+    def __init__(self, datapath):
+        self.datapath = datapath
+
+
+def run(config, seed): #one benchmark, the result is a JSON-serializable dict
+    rng = random.Random(seed)
+    kind = config['topology']
+    if kind == 'fat-tree':
+        links, edges = topology_links(topology.fat_tree(config['k']))
+    elif kind == 'leaf-spine':
+        links, edges = topology_links(topology.leaf_spine(config['leaves'], config['spines']))
+    elif kind == 'random':
+        links, edges = random_graph(config['switches'], config['degree'], rng)
+    else:
+        raise ValueError('unknown topology %s' % kind)
+
+    bench = Benchmark(links, edges)
+    started = time.perf_counter()
+    bench.build_topology()
+    topology_time = time.perf_counter() - started
+    bench.learn_hosts()
+    latency, elapsed = bench.run_flows(config['flows'], rng)
+
+    ctl = bench.ctl
+    flows = config['flows']
+    result = {
+        'config': dict(config, seed=seed),
+        'switches': len(bench.datapaths),
+        'links': len(links),
+        'hosts': len(bench.hosts),
+        'topology_seconds': round(topology_time, 6),
+        'packet_ins_per_second': round(flows / elapsed, 1),
+        'setup_latency_us': dict((name, round(latency.percentile(q) / 1000.0, 1)) for name, q in PERCENTILES),
+        'flowmods_per_flow': round(bench.counts['OFPFlowMod'] / float(flows), 3),
+        'groupmods_per_flow': round(bench.counts['OFPGroupMod'] / float(flows), 3),
+        'barriers_per_flow': round(bench.counts['OFPBarrierRequest'] / float(flows), 3),
+        'flowmods_avoided': ctl.flowmods_avoided,
+        'controller_us': dict((name, round(h.percentile(0.99) / 1000.0, 1)) for name, h in sorted(ctl.timers.items())),
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the dijkstra.py controller.')
+    parser.add_argument('--topology', choices=['fat-tree', 'leaf-spine', 'random'])
+    parser.add_argument('--k', type=int, default=4, help='ports of the fat-tree switches')
+    parser.add_argument('--leaves', type=int, default=16)
+    parser.add_argument('--spines', type=int, default=4)
+    parser.add_argument('--switches', type=int, default=100, help='switches of the random graph')
+    parser.add_argument('--degree', type=int, default=4, help='average degree of the random graph')
+    parser.add_argument('--flows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON file of the results, stdout by default')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL) #the debug messages of the controller would be the benchmark
+    dijkstra.path_workers = 0 #the paths are computed in the packet-in handler, where the latency of every flow is measured
+    if args.topology is None:
+        configs = SUITE
+    else:
+        # only the parameters of the chosen topology are part of the result
+        config = {'topology': args.topology, 'flows': args.flows}
+        if args.topology == 'fat-tree':
+            config['k'] = args.k
+        elif args.topology == 'leaf-spine':
+            config.update(leaves=args.leaves, spines=args.spines)
+        else:
+            config.update(switches=args.switches, degree=args.degree)
+        configs = [config]
+    results = {
+        'python': platform.python_version(),
+        'vectorized': dijkstra.csgraph_dijkstra is not None,
+        'results': [run(config, args.seed) for config in configs],
+    }
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,135 @@
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
+from ryu.controller.handler import HANDSHAKE_DISPATCHER, CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
 from ryu.lib.packet import arp
-from ryu.lib.packet import ethernet
-from ryu.lib.packet import ipv6,ipv4
+from ryu.lib.packet import ether_types
 from ryu.topology import event
+from ryu.topology.switches import Port
+from ryu.lib import hub
+from ryu import cfg
 from ryu.ofproto.ofproto_v1_2 import OFPG_ANY
+from ryu.app.wsgi import ControllerBase, WSGIApplication, route
+from webob import Response
 
+from metrics import LatencyHistogram, prometheus_text
+import routing
+import snapshot
+import topology
+import workers
+
+from array import array
 from collections import defaultdict
 
-import random, time
+import heapq, pickle, socket, struct, time
+
+from workers import csgraph_dijkstra #None without SciPy, the vectorized backend is optional
 
 idle_time = 3000
+precompute_paths = False #computes the trees of all the switches in background once the topology is stable
+topology_settle_time = 5 #seconds without topology events before precomputing
+
+probe_interval = 2 #seconds between two link delay measurements
+min_link_delay = 0.1 #ms, lower bound of the link costs
+delay_ewma_alpha = 0.25 #weight of a new delay sample
+jitter_ewma_alpha = 0.125 #weight of a new jitter sample
+cost_update_threshold = 0.2 #relative delay change which makes the routes be recomputed
+cost_update_min_delta = 0.5 #ms, smallest delay change which makes the routes be recomputed
+multipath = False #spreads the flows over the equal (or near equal) cost paths with SELECT groups
+multipath_stretch = 0.0 #extra cost allowed for a next hop, relative to the shortest path (0 is ECMP)
+max_paths = 4 #maximum number of next hops of a switch
+fast_failover = False #keeps a loop-free backup next hop in a FAST_FAILOVER group on the switches of the paths
+proactive = False #pre-installs the paths of every known host pair once the topology is stable
+proactive_settle_time = 10 #seconds without topology events before the proactive installation
+proactive_setups_per_second = 50 #proactive path setups allowed per second on each datapath
+destination_forwarding = False #one rule per destination host and switch instead of one per host pair
+destination_prefix_len = None #aggregates the destinations of a prefix routed to the same switch (e.g. 24)
+setup_timeout = 2 #seconds after which a path setup still waiting for barrier replies is not joined anymore
+arp_timeout = 300 #seconds after which an ARP entry which has not been seen expires
+arp_refresh_time = 240 #seconds after which the controller asks the host to confirm its ARP entry
+arp_aging_interval = 10 #seconds between two checks of the ARP entries
+snapshot_interval = 30 #seconds between two snapshots of the state, when snapshot_file is set
+restored_link_timeout = 15 #seconds after which a restored link which LLDP did not find again is removed
+flood_tree_delay = 0.5 #seconds between a topology event and the update of the broadcast tree
+vectorized_min_switches = 200 #switches from which the NumPy/SciPy backend is used
+path_workers = 2 #processes computing the paths out of the hub, 0 computes them in the handlers
+worker_min_switches = 100 #switches from which the paths are computed by the workers
+FLOOD_GROUP_ID = 0xfffffe00 #ALL group of the broadcast tree, the same on every switch
+FLOOD_PRIORITY = 3 #broadcasts received from the tree win over the ARP path rules
+COOKIE_MASK = 0xffffffffffffffff #the path cookies are matched exactly
+PROBE_ETH_TYPE = 0x88b5 #local experimental ethertype of the link probes
+ETH_TYPE = struct.Struct('!H') #ethertype and ARP opcode fields
+MAC = struct.Struct('6B')
+ARP_HEADER = struct.Struct('!HHHBBH') #ethertype, then ARP hardware type, protocol type, sizes and opcode
+CONTROLLER_MAC = '02:00:00:00:00:00' #source MAC of the frames built by the controller
+PROBE_MAC = '02:00:00:00:00:01' #destination of the link probes, not a broadcast so that the tree rules do not flood them
+PROBE_HEADER = struct.pack('!6s6sH', bytes.fromhex(PROBE_MAC.replace(':', '')),
+                           bytes.fromhex(CONTROLLER_MAC.replace(':', '')), PROBE_ETH_TYPE)
+TIMERS = ('packet_in', 'parse', 'get_path', 'add_ports_to_path', 'flow_mod') #latency histograms of the hot paths
+METRICS_INSTANCE = 'routing_app' #name of the controller in the WSGI data
+
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt('topology_file', default=None,
+               help='topology description (topology.py format) giving the delays of the links'),
+    cfg.StrOpt('routing_strategy', default='dijkstra',
+               help='algorithm computing the paths (%s)' % ', '.join(sorted(routing.STRATEGIES))),
+    cfg.StrOpt('snapshot_file', default=None,
+               help='binary snapshot of the hosts, links and installed paths, saved periodically and reloaded at startup'),
+])
+
+
+def mac_to_str(data, offset): #'aa:bb:cc:dd:ee:ff' form of the MAC address at offset, as ryu prints it
+    return '%02x:%02x:%02x:%02x:%02x:%02x' % MAC.unpack_from(data, offset)
+
+
+def parse_frame(data, ethertype): #(dst MAC, src MAC, ARP opcode, src IP, dst IP) of a frame of ethertype, None for the missing fields
+    opcode = src_ip = dst_ip = None
+    if ethertype == ether_types.ETH_TYPE_IP and len(data) >= 34:
+        src_ip = socket.inet_ntoa(data[26:30])
+        dst_ip = socket.inet_ntoa(data[30:34])
+    elif ethertype == ether_types.ETH_TYPE_ARP and len(data) >= 42:
+        opcode = ETH_TYPE.unpack_from(data, 20)[0]
+        src_ip = socket.inet_ntoa(data[28:32])
+        dst_ip = socket.inet_ntoa(data[38:42])
+    return mac_to_str(data, 0), mac_to_str(data, 6), opcode, src_ip, dst_ip
+
+
+def restored_port(dpid, port_no): #port of a restored link, compared to the ones of the LLDP events by dpid and number
+    return Port(dpid, ofproto_v1_3, ofproto_v1_3_parser.OFPPort(port_no, '00:00:00:00:00:00', b'', 0, 0, 0, 0, 0, 0, 0, 0))
+
+
+def build_arp(opcode, src_mac, src_ip, dst_mac, dst_ip, eth_dst=None): #raw ethernet frame of an ARP packet
+    if eth_dst is None:
+        eth_dst = dst_mac if opcode == arp.ARP_REPLY else 'ff:ff:ff:ff:ff:ff'
+    return (bytes.fromhex(eth_dst.replace(':', '')) + bytes.fromhex(src_mac.replace(':', '')) +
+            ARP_HEADER.pack(ether_types.ETH_TYPE_ARP, 1, ether_types.ETH_TYPE_IP, 6, 4, opcode) +
+            bytes.fromhex(src_mac.replace(':', '')) + socket.inet_aton(src_ip) +
+            bytes.fromhex(dst_mac.replace(':', '')) + socket.inet_aton(dst_ip))
 
 
 class ProjectController(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(ProjectController, self).__init__(*args, **kwargs)
         self.topology_api_app = self
+        # latency of the hot paths in ns, exported in the Prometheus format on /metrics
+        self.timers = dict((name, LatencyHistogram()) for name in TIMERS)
+        self.flowmods_sent = 0
+        if 'wsgi' in kwargs:
+            kwargs['wsgi'].register(MetricsController, {METRICS_INSTANCE: self})
         self.datapath_list = {}
         self.arp_table = {}
         self.switches = []
         self.hosts = {}
-        self.multipath_group_ids = {}
-        self.group_ids = []
+        # path groups: (dpid, group type, src, dst) -> [group id, flow rules using it, buckets]
+        self.groups = {}
+        self.group_free = defaultdict(list) #dpid -> released group ids
+        self.group_next = {} #dpid -> last group id allocated
         self.adjacency = defaultdict(lambda:defaultdict(lambda:None))
         self.switches_count = 0
         self.links = []
@@ -36,106 +137,708 @@ class ProjectController(app_manager.RyuApp):
         self.datapaths = {}
         self.disable_packet_in = False
         self.pkt_count=0
-
-
-    def get_path (self, src, dst):
-        # executing Dijkstra's algorithm
-        #The shortest path will be obtained by considering
-        #the path having the lowest total delay
-        print("Delay-based shortest path research using Dijkstra's algorithm.")
-        print("The source node is", src,"and the destination node is", dst)
-    
-        # defining dictionaries for saving each node's distance and its previous node in the path from first node to that node
-        distance = {}
-        previous = {}
-
-        # setting initial distance of every node to infinity
-        for dpid in self.switches:
-            distance[dpid] = float('Inf')
-            previous[dpid] = None
-
-        # setting distance of the source to 0
-        distance[src] = 0
-
-        # creating a set of all nodes
-        Q = set(self.switches)
-
-        # checking for all undiscovered nodes whether there is a path that goes 
-        # through them to their adjacent nodes which will make its adjacent nodes closer to src
-        while len(Q) > 0:
-            # getting the closest node to src among undiscovered nodes
-            u = self.minimum_distance(distance, Q)
-            # removing the node from Q
-            Q.remove(u)
-            # calculate minimum distance for all adjacent nodes to u
-            for p in self.switches:
-                # if u and other switches are adjacent
-                if self.adjacency[u][p] != None:
-                    w = self.get_link_cost(u, p) #gets the cost of the link in terms of delay 
-                    #print("Link from", u,"to", p,"delay is", w, "ms")
-                    # if the path via u to p has lower cost then make the cost equal to this new path's cost
-                    if distance[u] + w < distance[p]:
-                        distance[p] = distance[u] + w
-                        previous[p] = u
+        self.pending_barriers = {}
+        self.packet_ins_avoided = 0
+        self.arp_seen = {} #ip -> last time its ARP entry was learned or refreshed
+        self.arp_proxied = 0
+        self.arp_thread = hub.spawn(self._age_arp_table)
+        # broadcast tree: per switch (tree ports, edge ports), switches having the flood group
+        self.switch_ports = {}
+        self.link_ports = defaultdict(set)
+        self.flood_ports = {}
+        self.flood_groups = set()
+        self.flood_tree_dirty = False
+        self.flood_thread = hub.spawn(self._update_flood_tree)
+        self.inflight_setups = {} #(ip_src, ip_dst) -> PathSetup, ip_src is None for destination forwarding
+        self.setups_coalesced = 0
+        self.path_cache = {}
+        self.trees = {}
+        self.csgraph = None
+        self.topology_epoch = 0
+        self.topology_changed_at = time.time()
+        self.precomputed_epoch = None
+        # the trees and the all-pairs matrix of large topologies come from the worker processes
+        self.workers = workers.PathWorkers(path_workers) if path_workers else None
+        self.graph_version = 0 #incremented by every topology and link change
+        self.structure_version = 0 #incremented only when switches or links come or go, not when a link cost changes
+        self.csgraph_version = None #graph and structure versions the all-pairs matrix was computed on
+        self.csgraph_structure = None
+        self.link_logs = [] #link events missed by the computations running in the workers, one list per computation
+        self.tree_requests = {} #root switch -> event set once the workers returned its tree
+        self.all_pairs_request = None
+        self.snapshot_cache = None #(graph_version, pickled topology snapshot)
+        self.router = routing.get_strategy(CONF.routing_strategy)(self)
+        self.logger.info("Paths computed with the %s routing strategy.", self.router.name)
+        # delay and bandwidth of the links read from the topology file, (s1, s2) with s1 < s2 -> (delay, bw)
+        self.link_table = {}
+        if CONF.topology_file:
+            self.link_table = topology.link_table(topology.load(CONF.topology_file))
+            self.logger.info("%d link delays read from %s.", len(self.link_table), CONF.topology_file)
+        # measured delays, one slot per link (see get_link_id)
+        self.link_index = {}
+        self.link_delay = array('d')
+        self.link_jitter = array('d')
+        self.link_cost = array('d')
+        self.link_measured = array('b')
+        self.echo_rtt = {}
+        self.measure_thread = hub.spawn(self._measure_links)
+        if precompute_paths:
+            self.precompute_thread = hub.spawn(self._precompute_paths)
+        # (ip_src, ip_dst) pairs installed by switch pair, and the ones the proactive mode still has to install
+        self.installed_pairs = defaultdict(set)
+        # cookie of every host path, the switches it was installed on and the links it crosses
+        self.path_cookies = {} #(ip_src, ip_dst) -> cookie
+        self.cookie_paths = {} #cookie -> (ip_src, ip_dst, switches, links)
+        self.link_paths = defaultdict(set) #(s1, s2) with s1 < s2 -> cookies of the paths crossing the link
+        self.next_cookie = 1
+        # rules sent for the host paths, indexed by host pair and by switch
+        self.flow_registry = {} #(dpid, ip_src, ip_dst) -> (actions, cookie)
+        self.pair_flows = defaultdict(set) #(ip_src, ip_dst) -> dpids having its rules
+        self.switch_flows = defaultdict(set) #dpid -> (ip_src, ip_dst) pairs having rules on it
+        self.stale_flows = set() #(dpid, ip_src, ip_dst) registry entries the switch lost, sent again on the next install
+        self.expired_flows = {} #(dpid, ip_src, ip_dst) -> eth types of its entries (IPv4, ARP) which expired
+        self.flowmods_avoided = 0
+        self.proactive_queue = set()
+        self.proactive_hosts = set()
+        self.proactive_budget = {}
+        if proactive:
+            self.proactive_thread = hub.spawn(self._proactive_install)
+        # destination forwarding: destination -> {dpid: out_port} and destination -> root switch
+        self.destination_rules = {}
+        self.destination_roots = {}
+        self.destination_cookies = {} #destination -> cookie of its rules, whose expiry is notified
+        self.cookie_destinations = {}
+        self.prefix_roots = {}
+        # warm restart: the state of the previous run is reloaded and checked against the flow stats of the switches
+        self.restored_links = set() #(s1, s2) restored links which LLDP did not find again yet
+        self.restored_at = None
+        self.switch_entered_at = {}
+        # reconnected switches whose flow and group stats are being collected
+        self.reconciling = {} #dpid -> Reconciliation
+        if CONF.snapshot_file:
+            self.restore_snapshot(CONF.snapshot_file)
+            self.snapshot_thread = hub.spawn(self._save_snapshots)
+
+
+    def get_path(self, src, dst): #switches from src to dst, computed by the routing strategy of the configuration
+        return self.router.get_path(src, dst)
+
+    def shortest_path(self, src, dst): #delay-based shortest path, used by the dijkstra strategy
+        if src == dst:
+            return [src] #the dst is in the src node
+
+        # paths computed in the current topology epoch are reused, the reverse
+        # path is read from the forward entry because link costs are symmetric
+        cached = self.path_cache.get((src, dst))
+        if cached is not None and cached[0] == self.topology_epoch:
+            return list(cached[1])
+        cached = self.path_cache.get((dst, src))
+        if cached is not None and cached[0] == self.topology_epoch:
+            return cached[1][::-1]
+
+        # large topologies are routed from the all-pairs predecessor matrix
+        if self.use_vectorized():
+            path = self.vectorized_path(src, dst)
+        # the shortest path trees are kept up to date on link events,
+        # so the path is just a walk over the previous nodes
+        elif src in self.trees:
+            path = self.path_from_tree(self.trees[src][1], src, dst)
+        elif dst in self.trees:
+            path = self.path_from_tree(self.trees[dst][1], dst, src)[::-1]
+        else:
+            # executing Dijkstra's algorithm
+            #The shortest path will be obtained by considering
+            #the path having the lowest total delay
+            self.logger.debug("Delay-based shortest path research using Dijkstra's algorithm.")
+            self.logger.debug("The source node is %s and the destination node is %s", src, dst)
+            self.trees[src] = self.shortest_path_tree(src)
+            path = self.path_from_tree(self.trees[src][1], src, dst)
+
+        self.path_cache[src, dst] = (self.topology_epoch, path)
+        return list(path) #the final ordered path
+
+    def get_neighbours(self, u): #real neighbours of u with the cost of the link towards them
+        for p, port in self.adjacency[u].items():
+            if port is not None and p in self.datapath_list:
+                yield p, self.get_link_cost(u, p) #gets the cost of the link in terms of delay
+
+    def shortest_path_tree(self, src): #Dijkstra from src over the whole topology, the trees are kept for the other destinations
+        # the same implementation runs in the worker processes on a snapshot of the topology
+        return workers.shortest_path_tree(self.get_neighbours, src)
+
+    def path_from_tree(self, previous, src, dst): #walks the previous nodes back from dst to src
+        if src == dst:
+            return [src]
 
         # creating a list of switches between src and dst which are in the shortest path obtained by Dijkstra's algorithm reversely
         r = []
         p = dst
         r.append(p)
-        # set q to the last node before dst 
-        q = previous[p]
+        # set q to the last node before dst
+        q = previous.get(p)
         while q is not None:
-            if q == src:
-                r.append(q)
-                break
-            p = q
-            r.append(p)
-            q = previous[p]
+            r.append(q)
+            q = previous[q]
 
         # reversing r as it was from dst to src
         r.reverse()
 
-        # setting path 
+        return r
+
+    def topology_changed(self): #every cached path and tree belongs to an older epoch from now on
+        self.topology_epoch += 1
+        self.topology_changed_at = time.time()
+        self.path_cache = {}
+        self.trees = {}
+        self.csgraph = None
+        self.graph_version += 1
+        self.structure_version += 1
+        self.router.topology_changed()
+        # every proactive path has to be checked again
+        for pairs in self.installed_pairs.values():
+            self.proactive_queue |= pairs
+        # and every destination tree rebuilt
+        if self.destination_rules:
+            self.reinstall_destinations(set(self.destination_roots.values()))
+
+    def link_changed(self, u, v): #repairs the trees after the link u-v has been added, removed or changed cost
+        self.topology_changed_at = time.time()
+        self.graph_version += 1
+        for log in self.link_logs:
+            log.append((u, v))
+        changed = set()
+        if self.use_workers() and (self.csgraph is not None or self.all_pairs_request is not None):
+            # the routes changed by the new matrix are reported once the workers return it,
+            # until then no cached path can be trusted
+            self.path_cache = {}
+            hub.spawn(self.refresh_all_pairs)
+        elif self.csgraph is not None:
+            changed = self.vectorized_update()
+        for src, tree in self.trees.items():
+            for dst in self.repair_tree(tree, u, v):
+                changed.add((src, dst))
+        changed |= self.router.link_changed(u, v)
+        self.routes_changed(changed)
+        return changed
+
+    def routes_changed(self, changed): #the route between the switch pairs changed, their paths are installed again
+        # only the pairs whose route changed are evicted from the cache
+        pairs = set()
+        for src, dst in changed:
+            self.path_cache.pop((src, dst), None)
+            self.path_cache.pop((dst, src), None)
+            pairs |= self.installed_pairs.get((src, dst), set())
+            pairs |= self.installed_pairs.get((dst, src), set())
+        # and only the host paths between them move to the new route, whatever the mode;
+        # install_path sends nothing to the switches whose rules stay the same
+        self.proactive_queue -= pairs
+        for ip_src, ip_dst in pairs:
+            hosts = self.get_host_pair(ip_src, ip_dst)
+            if hosts is not None:
+                h1, h2 = hosts
+                self.install_path(h1[0], h1[1], h2[0], h2[1], ip_src, ip_dst)
+        if changed and self.destination_rules:
+            # the trees rooted in the destination switches report every changed route
+            self.reinstall_destinations(set(src for src, dst in changed))
+
+    def repair_tree(self, tree, u, v): #dynamic SSSP update of one tree in the Ramalingam-Reps style
+        distance, previous = tree
+        changed = set()
+
+        # the link of the tree got worse or disappeared: only the subtree hanging from it is affected
+        if previous.get(v) == u and self.tree_link_worse(tree, u, v):
+            changed |= self.repair_tree_increase(tree, v)
+        elif previous.get(u) == v and self.tree_link_worse(tree, v, u):
+            changed |= self.repair_tree_increase(tree, u)
+
+        # the link got better or appeared: relax it in both directions, a cheaper
+        # link of the tree lowers the distances of its whole subtree from there
+        changed |= self.repair_tree_decrease(tree, u, v)
+        changed |= self.repair_tree_decrease(tree, v, u)
+        return changed
+
+    def tree_link_worse(self, tree, u, v): #the link u-v, by which the tree reaches v, was removed or costs more
+        distance = tree[0]
+        if self.adjacency[u].get(v) is None or u not in self.datapath_list or v not in self.datapath_list:
+            return True
+        return distance[u] + self.get_link_cost(u, v) > distance[v]
+
+    def repair_tree_increase(self, tree, root):
+        distance, previous = tree
+
+        # collecting the nodes whose shortest path goes through root
+        children = defaultdict(list)
+        for node, prev in previous.items():
+            if prev is not None:
+                children[prev].append(node)
+        affected = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            affected.add(node)
+            stack.extend(children[node])
+
+        old_previous = {}
+        for node in affected:
+            old_previous[node] = previous.pop(node)
+            del distance[node]
+
+        # the affected nodes restart from their best neighbour outside the subtree
+        heap = []
+        for node in affected:
+            for p, w in self.get_neighbours(node):
+                if p not in affected and p in distance and distance[p] + w < distance.get(node, float('Inf')):
+                    distance[node] = distance[p] + w
+                    previous[node] = p
+            if node in distance:
+                heapq.heappush(heap, (distance[node], node))
+
+        # Dijkstra restricted to the affected nodes, the others keep their distance
+        changed = set()
+        settled = set()
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            # a route changes when its previous node or the route towards it changes
+            if previous[u] != old_previous[u] or previous[u] in changed:
+                changed.add(u)
+            for p, w in self.get_neighbours(u):
+                if p in affected and p not in settled and d + w < distance.get(p, float('Inf')):
+                    distance[p] = d + w
+                    previous[p] = u
+                    heapq.heappush(heap, (d + w, p))
+
+        # nodes which are not reachable anymore
+        changed |= affected - settled
+        return changed
+
+    def repair_tree_decrease(self, tree, u, v):
+        distance, previous = tree
+        if u not in distance or self.adjacency[u].get(v) is None or v not in self.datapath_list:
+            return set()
+        d = distance[u] + self.get_link_cost(u, v)
+        if d >= distance.get(v, float('Inf')):
+            return set()
+
+        # the nodes whose distance improves are relaxed from v, but only the ones
+        # whose previous node or the route towards it changed get a new route
+        old_previous = {v: previous.get(v)}
+        distance[v] = d
+        previous[v] = u
+        changed = set()
+        heap = [(d, v)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > distance[u]:
+                continue
+            if previous[u] != old_previous[u] or previous[u] in changed:
+                changed.add(u)
+            for p, w in self.get_neighbours(u):
+                if d + w < distance.get(p, float('Inf')):
+                    old_previous.setdefault(p, previous.get(p))
+                    distance[p] = d + w
+                    previous[p] = u
+                    heapq.heappush(heap, (d + w, p))
+        return changed
+
+    def _precompute_paths(self): #builds the trees of all the switches once the topology is stable
+        while True:
+            hub.sleep(1)
+            if self.precomputed_epoch == self.topology_epoch:
+                continue
+            if time.time() - self.topology_changed_at < topology_settle_time:
+                continue
+
+            epoch = self.topology_epoch
+            if self.use_workers():
+                self.precompute_in_workers(epoch)
+                continue
+            if self.use_vectorized():
+                self.vectorized_update()
+                self.precomputed_epoch = epoch
+                self.logger.debug("All-pairs paths precomputed for %d switches.", len(self.switches))
+                continue
+            for src in list(self.switches):
+                if src not in self.trees:
+                    tree = self.shortest_path_tree(src)
+                    if epoch != self.topology_epoch:
+                        break #the topology changed again, wait for it to settle
+                    self.trees[src] = tree
+                hub.sleep(0) #let the other handlers run between sources
+            else:
+                self.precomputed_epoch = epoch
+                self.logger.debug("All-pairs paths precomputed for %d switches.", len(self.switches))
+
+    def precompute_in_workers(self, epoch): #the same in the worker processes, the hub only receives the results
+        if self.use_vectorized():
+            self.wait_all_pairs()
+            done = self.csgraph is not None and self.csgraph_structure == self.structure_version
+        else:
+            sources = [src for src in self.switches if src not in self.trees]
+            missed = self.start_link_log()
+            try:
+                trees = self.workers.map_batches(workers.shortest_path_trees, self.topology_snapshot(), sources)
+            finally:
+                self.stop_link_log(missed)
+            done = epoch == self.topology_epoch
+            for root, tree in trees.items():
+                if not done or root in self.trees:
+                    continue #computed again with the new switches, or meanwhile for a path
+                if root in self.datapath_list and self.catch_up_tree(tree, missed):
+                    self.trees[root] = tree
+                else:
+                    done = False #the next round computes it again
+        if done and epoch == self.topology_epoch:
+            self.precomputed_epoch = epoch
+            self.logger.debug("All-pairs paths precomputed by %d workers for %d switches.",
+                              self.workers.processes, len(self.switches))
+
+    def _proactive_install(self): #installs the paths of all the known host pairs without waiting for their packets
+        while True:
+            hub.sleep(1)
+            if time.time() - self.topology_changed_at < proactive_settle_time:
+                continue
+
+            # the hosts learned since the last round are paired with all the known ones
+            known = [ip for ip in self.arp_table if self.arp_table[ip] in self.hosts]
+            for ip in known:
+                if ip not in self.proactive_hosts:
+                    for other in self.proactive_hosts:
+                        self.proactive_queue.add((ip, other))
+                        self.proactive_queue.add((other, ip))
+                    self.proactive_hosts.add(ip)
+
+            while self.proactive_queue:
+                if time.time() - self.topology_changed_at < proactive_settle_time:
+                    break #the topology is changing again
+                ip_src, ip_dst = self.proactive_queue.pop()
+                hosts = self.get_host_pair(ip_src, ip_dst)
+                if hosts is None:
+                    continue
+                h1, h2 = hosts
+                if self.use_workers() and not self.wait_path(h1[0], h2[0]):
+                    continue
+                self.wait_proactive_budget(self.get_path(h1[0], h2[0]))
+                self.install_path(h1[0], h1[1], h2[0], h2[1], ip_src, ip_dst)
+
+    def get_host_pair(self, ip_src, ip_dst): #(switch, port) of both hosts, None if one of them is not reachable
+        h1 = self.hosts.get(self.arp_table.get(ip_src))
+        h2 = self.hosts.get(self.arp_table.get(ip_dst))
+        if h1 is None or h2 is None or h1[0] not in self.datapath_list or h2[0] not in self.datapath_list:
+            return None
+        return h1, h2
+
+
+    def wait_proactive_budget(self, path): #rate limit of the proactive setups on every datapath of the path
+        while True:
+            now = time.time()
+            wait = 0
+            for dpid in path:
+                start, count = self.proactive_budget.get(dpid, (now, 0))
+                if now - start >= 1:
+                    start, count = now, 0
+                if count >= proactive_setups_per_second:
+                    wait = max(wait, start + 1 - now)
+                self.proactive_budget[dpid] = (start, count)
+            if wait <= 0:
+                break
+            hub.sleep(wait)
+        for dpid in path:
+            start, count = self.proactive_budget[dpid]
+            self.proactive_budget[dpid] = (start, count + 1)
+
+    def use_vectorized(self): #the csgraph backend pays off only on large topologies
+        return csgraph_dijkstra is not None and len(self.switches) >= vectorized_min_switches
+
+    def use_workers(self): #below worker_min_switches the paths are computed faster than they are sent to a process
+        return self.workers is not None and len(self.switches) >= worker_min_switches
+
+    def close(self): #called by the app manager when the controller stops
+        if self.workers is not None:
+            self.workers.shutdown()
+
+    def shortest_path_ready(self, src, dst): #True if shortest_path does not have to compute a tree or the all-pairs matrix
+        if src == dst:
+            return True
+        # a matrix computed before the last cost changes is used while the workers refresh it,
+        # one computed before links came or went could route the packets over missing links
+        if self.use_vectorized() and self.csgraph is not None and self.csgraph_structure != self.structure_version:
+            return False #the workers are computing the matrix of the new links
+        for key in ((src, dst), (dst, src)):
+            cached = self.path_cache.get(key)
+            if cached is not None and cached[0] == self.topology_epoch:
+                return True
+        if self.use_vectorized():
+            return self.csgraph is not None
+        if multipath or fast_failover:
+            return dst in self.trees #the DAG and the backups are read from the tree of dst
+        return src in self.trees or dst in self.trees
+
+    def wait_path(self, src, dst): #blocks the calling greenthread until the workers computed what the path needs
+        while not self.router.path_ready(src, dst):
+            if src not in self.datapath_list or dst not in self.datapath_list:
+                return False
+            if self.use_vectorized():
+                self.wait_all_pairs()
+            else:
+                # both directions of a host pair are read from the same tree
+                self.wait_tree(dst if multipath or fast_failover else min(src, dst))
+        return True
+
+    def missing_trees(self, src, dst): #roots of the trees the installation reads besides the path, which are not computed yet
         if src == dst:
-            return[src] #the dst is in the src node
+            return []
+        if multipath:
+            roots = [dst] #the DAG of the next hops
+        elif fast_failover:
+            roots = self.get_path(src, dst) #the backups need the tree of dst and of every switch of the path
         else:
-            path=r
+            return []
+        return [root for root in roots if root not in self.trees]
 
-        return path #the final ordered path
+    def wait_trees(self, roots): #trees of several roots, computed in parallel by the workers
+        threads = [hub.spawn(self.wait_tree, root) for root in roots]
+        hub.joinall(threads)
 
-    # getting the node with lowest distance in Q
-    def minimum_distance(self, distance, Q):
-        min = float('Inf')
-        node = 0
-        for v in Q:
-            if distance[v] < min:
-                min = distance[v]
-                node = v
-        return node
+    def wait_tree(self, root): #tree of root computed by a worker, shared by the greenthreads waiting for it
+        done = self.tree_requests.get(root)
+        if done is not None:
+            done.wait()
+            return
+        done = self.tree_requests[root] = hub.Event()
+        missed = self.start_link_log()
+        try:
+            epoch = self.topology_epoch
+            tree = self.workers.call(workers.shortest_path_trees, self.topology_snapshot(), [root])[root]
+            # the link events which happened meanwhile are repaired like in the other trees,
+            # the tree of a topology whose switches changed is computed again by the next wait
+            if epoch == self.topology_epoch and root in self.datapath_list and self.catch_up_tree(tree, missed):
+                self.trees[root] = tree
+        finally:
+            self.stop_link_log(missed)
+            del self.tree_requests[root]
+            done.set()
+
+    def start_link_log(self): #list receiving the link events from now on, for a computation running in the workers
+        log = []
+        self.link_logs.append(log)
+        return log
+
+    def stop_link_log(self, log):
+        self.link_logs = [other for other in self.link_logs if other is not log]
+
+    def catch_up_tree(self, tree, missed): #repairs a tree computed by the workers with the link events it missed, True if it is exact
+        for u, v in missed:
+            self.repair_tree(tree, u, v)
+        return not missed or self.tree_exact(tree)
+
+    def tree_exact(self, tree): #True if the tree is a shortest path tree of the current topology
+        # every tree link exists and is tight, and no link can shorten a distance
+        distance, previous = tree
+        for u, d in distance.items():
+            if u not in self.datapath_list:
+                return False
+            p = previous[u]
+            if p is None and d != 0:
+                return False
+            if p is not None and (self.adjacency[p].get(u) is None or
+                                  abs(distance[p] + self.get_link_cost(p, u) - d) > 1e-9):
+                return False
+            for q, w in self.get_neighbours(u):
+                if d + w < distance.get(q, float('Inf')) - 1e-9:
+                    return False
+        return True
+
+    def wait_all_pairs(self): #all-pairs matrix computed by a worker, shared by the greenthreads waiting for it
+        if self.all_pairs_request is not None:
+            self.all_pairs_request.wait()
+            return
+        done = self.all_pairs_request = hub.Event()
+        try:
+            version = self.graph_version
+            structure = self.structure_version
+            nodes, index, rows, cols, weights = self.csgraph_arrays()
+            # the routes which changed are found by the worker too
+            predecessors, changed = self.workers.call(workers.all_pairs_predecessors, len(nodes), rows, cols, weights,
+                                                      self.previous_predecessors(nodes))
+            # a matrix which only missed some cost changes is used until the refresh catches up,
+            # so that the paths keep being installed while the delays move
+            if structure == self.structure_version:
+                self.routes_changed(self.set_predecessors(nodes, index, predecessors, changed, version, structure))
+        finally:
+            self.all_pairs_request = None
+            done.set()
+
+    def refresh_all_pairs(self): #recomputes the matrix in the workers until it matches the current link costs
+        while (self.csgraph is not None or self.all_pairs_request is not None) and self.csgraph_version != self.graph_version:
+            self.wait_all_pairs()
+
+    def topology_snapshot(self): #neighbours of every switch with the link costs, pickled once per graph version for the workers
+        if self.snapshot_cache is None or self.snapshot_cache[0] != self.graph_version:
+            neighbours = dict((u, list(self.get_neighbours(u))) for u in self.switches)
+            self.snapshot_cache = (self.graph_version, pickle.dumps(neighbours, pickle.HIGHEST_PROTOCOL))
+        return self.snapshot_cache[1]
+
+    def csgraph_arrays(self): #switches, their index and the weight matrix in COO form built from the adjacency and the link costs
+        nodes = sorted(self.switches)
+        index = dict((dpid, i) for i, dpid in enumerate(nodes))
+        rows = []
+        cols = []
+        weights = []
+        for u in nodes:
+            for p, w in self.get_neighbours(u):
+                rows.append(index[u])
+                cols.append(index[p])
+                weights.append(w)
+        return nodes, index, rows, cols, weights
+
+    def vectorized_update(self): #recomputes the all-pairs predecessor matrix, returns the pairs whose route changed
+        nodes, index, rows, cols, weights = self.csgraph_arrays()
+        predecessors, changed = workers.all_pairs_predecessors(len(nodes), rows, cols, weights, self.previous_predecessors(nodes))
+        return self.set_predecessors(nodes, index, predecessors, changed, self.graph_version, self.structure_version)
+
+    def previous_predecessors(self, nodes): #current matrix, if it is about the same switches
+        if self.csgraph is None or self.csgraph[0] != nodes:
+            return None
+        return self.csgraph[2]
+
+    def set_predecessors(self, nodes, index, predecessors, changed, version, structure): #new all-pairs matrix, returns the pairs whose route changed
+        self.csgraph = (nodes, index, predecessors)
+        self.csgraph_version = version
+        self.csgraph_structure = structure
+        if changed is None:
+            return set()
+
+        pairs = set()
+        for i, j in zip(*changed):
+            pairs.add((nodes[i], nodes[j]))
+        for src, dst in pairs:
+            self.path_cache.pop((src, dst), None)
+            self.path_cache.pop((dst, src), None)
+        return pairs
+
+    def vectorized_path(self, src, dst): #O(path length) walk over the predecessor matrix
+        if self.csgraph is None:
+            self.logger.debug("All-pairs shortest path research on %d switches.", len(self.switches))
+            self.vectorized_update()
+        nodes, index, predecessors = self.csgraph
+        if src not in index or dst not in index:
+            return [dst]
+        i = index[src]
+        j = index[dst]
+        row = predecessors[i]
+
+        r = [dst]
+        while row[j] >= 0:
+            j = row[j]
+            r.append(nodes[j])
+        r.reverse()
+        return r
 
     def get_link_cost(self, s1, s2): #Link cost between two generic switches s1 and s2
+        # the cost is the measured delay committed for routing, links which have
+        # not been measured yet cost their delay in the topology file
+        key = (s1, s2) if s1 < s2 else (s2, s1)
+        idx = self.link_index.get(key)
+        if idx is None:
+            return self.get_link_prior(key)
+        return self.link_cost[idx] #measured delay between s1 and s2
+
+    def get_link_prior(self, key): #delay of the link in the topology file, the default delay of topology.py (hop count routing) without it
+        return max(topology.link_delay(self.link_table, *key), min_link_delay)
+
+    def get_link_id(self, s1, s2): #index of the link s1-s2 in the per-link arrays
+        key = (s1, s2) if s1 < s2 else (s2, s1)
+        idx = self.link_index.get(key)
+        if idx is None:
+            idx = len(self.link_delay)
+            self.link_index[key] = idx
+            prior = self.get_link_prior(key)
+            self.link_delay.append(prior)
+            self.link_jitter.append(0.0)
+            self.link_cost.append(prior)
+            self.link_measured.append(0)
+        return idx
+
+    def _measure_links(self): #periodic echo and link probes used to measure the link delays
+        while True:
+            for dp in list(self.datapaths.values()):
+                self.send_echo_request(dp)
+            hub.sleep(probe_interval / 2.0) #lets the echo replies update the controller RTTs first
+
+            for s1 in list(self.adjacency):
+                dp = self.datapath_list.get(s1)
+                if dp is None:
+                    continue
+                for s2, port in list(self.adjacency[s1].items()):
+                    if port is not None:
+                        self.send_link_probe(dp, port)
+            hub.sleep(probe_interval / 2.0)
+
+    def send_echo_request(self, datapath):
+        ofp_parser = datapath.ofproto_parser
+        req = ofp_parser.OFPEchoRequest(datapath, data=struct.pack('!d', time.time()))
+        datapath.send_msg(req)
 
-        if (self.switches_count<10): #used to understand how complex the network is 
-            factor = 2
-        else:
-            factor = 4
-        
-        delay = float(0)
-        value = float((s1+s2)/factor) #index evaluating depending on the scaling factor
-        
-        if(value < 2.5 or value > 6.9):
-            delay = 4
-        elif(value > 4.5 and value <5.5):
-            delay = 4
-        elif(value > 3 and value <4):
-            delay = 10
-        elif(value >5.4 and value <6):
-            delay = 10
+    def send_link_probe(self, datapath, port): #the probe comes back as a packet-in from the switch on the other side
+        ofproto = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
+        data = PROBE_HEADER + struct.pack('!QId', datapath.id, port, time.time())
+        actions = [ofp_parser.OFPActionOutput(port)]
+        out = ofp_parser.OFPPacketOut(
+            datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+            in_port=ofproto.OFPP_CONTROLLER, actions=actions, data=data)
+        datapath.send_msg(out)
+
+    @set_ev_cls(ofp_event.EventOFPEchoReply, [HANDSHAKE_DISPATCHER, CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _echo_reply_handler(self, ev): #RTT between the controller and the switch
+        msg = ev.msg
+        try:
+            sent, = struct.unpack('!d', msg.data)
+        except (struct.error, TypeError):
+            return
+        rtt = (time.time() - sent) * 1000
+        dpid = msg.datapath.id
+        if dpid in self.echo_rtt:
+            rtt = self.echo_rtt[dpid] + delay_ewma_alpha * (rtt - self.echo_rtt[dpid])
+        self.echo_rtt[dpid] = rtt
+
+    def link_probe_received(self, dpid, data): #called by the packet-in handler for the probe frames
+        try:
+            src, port, sent = struct.unpack_from('!QId', data, len(PROBE_HEADER))
+        except struct.error:
+            return
+        if self.adjacency[src].get(dpid) != port:
+            return #the link is not known (anymore)
+
+        # one way delay of the probe without the controller-switch legs
+        sample = (time.time() - sent) * 1000
+        sample -= (self.echo_rtt.get(src, 0) + self.echo_rtt.get(dpid, 0)) / 2
+        sample = max(sample, 0.0)
+
+        # EWMA of the delay and of its variation (jitter)
+        idx = self.get_link_id(src, dpid)
+        if self.link_measured[idx]:
+            delay = self.link_delay[idx]
+            self.link_delay[idx] = delay + delay_ewma_alpha * (sample - delay)
+            self.link_jitter[idx] += jitter_ewma_alpha * (abs(sample - delay) - self.link_jitter[idx])
         else:
-            delay= 7
-        
-        return delay #elaborated delay between s1 and s2
-        
+            self.link_delay[idx] = sample
+            self.link_measured[idx] = 1
+
+        # the routing cost only follows the delay when it moves enough, relatively and
+        # in absolute terms, so that the noise of the sub-ms links does not keep rerouting
+        # the flows nor postpone the precomputation and the proactive installation
+        delay = self.link_delay[idx]
+        cost = self.link_cost[idx]
+        if abs(delay - cost) > max(cost_update_threshold * max(cost, min_link_delay), cost_update_min_delta):
+            self.link_cost[idx] = max(delay, min_link_delay)
+            changed = self.link_changed(src, dpid)
+            if changed:
+                self.logger.debug("The delay of the link from s%s to s%s is now %.2f ms, the route of %d switch pairs changed.",
+                                  src, dpid, delay, len(changed))
 
     def get_path_cost(self, path): #total cost of the path 
         cost = 0
@@ -143,13 +846,6 @@ class ProjectController(app_manager.RyuApp):
             cost += self.get_link_cost(path[i], path[i+1])
         return cost
 
-    def generate_openflow_gid(self): #generate a random OpenFlow group ID
-        
-        n = random.randint(0, 2**32)
-        while n in self.group_ids:
-            n = random.randint(0, 2**32)
-        return n
-
     def add_ports_to_path(self, path, dst, first_port, last_port): #Add the connection ports to the path
         
         p = []
@@ -162,184 +858,826 @@ class ProjectController(app_manager.RyuApp):
         return p
 
 
-    def install_path(self, src, first_port, dst, last_port, ip_src, ip_dst): #This installs the path in terms of openflow rules 
+    def get_multipath(self, src, dst): #next hops of every switch on the DAG of the (near) shortest paths towards dst
+        # the tree rooted in dst gives the distance of every switch to dst (link costs are symmetric)
+        if dst not in self.trees:
+            self.trees[dst] = self.shortest_path_tree(dst)
+        distance = self.trees[dst][0]
+
+        next_hops = {}
+        stack = [src]
+        while stack:
+            u = stack.pop()
+            if u in next_hops or u == dst or u not in distance:
+                continue
+            # only neighbours strictly closer to dst are used, so the paths can not loop
+            hops = []
+            for p, w in self.get_neighbours(u):
+                if p in distance and distance[p] < distance[u] and \
+                        w + distance[p] <= distance[u] * (1 + multipath_stretch) + 1e-9:
+                    hops.append((w + distance[p], p))
+            hops.sort()
+            next_hops[u] = [(p, cost) for cost, p in hops[:max_paths]]
+            stack.extend(p for p, cost in next_hops[u])
+        return next_hops
+
+    def get_backup_ports(self, path, dst): #loop-free backup port of every switch of path, and the rules of the detours
+        # the tree rooted in dst gives the distance of every switch to dst (link costs are symmetric)
+        if dst not in self.trees:
+            self.trees[dst] = self.shortest_path_tree(dst)
+        distance, previous = self.trees[dst]
+
+        position = dict((node, i) for i, node in enumerate(path))
+        backups = {}
+        detours = []
+        joins = {} #detour node -> position on path where its detour joins the primary path
+        for i, (u, v) in enumerate(zip(path[:-1], path[1:])):
+            # loop-free alternate (RFC 5286): the shortest path from the neighbour p to dst
+            # does not go back through u, so the detour can not loop when the link u-v fails
+            if u not in self.trees:
+                self.trees[u] = self.shortest_path_tree(u)
+            to_u = self.trees[u][0]
+            alternates = []
+            for p, w in self.get_neighbours(u):
+                if p != v and p in distance and distance[p] < to_u[p] + distance[u]:
+                    alternates.append((w + distance[p], p))
+
+            # the detour follows the tree of dst until it joins the primary path or an other
+            # detour; the primary path is not always the tree path (ant colony), so it must
+            # join after u, the rules upstream would send the packets back to the failed link
+            for cost, p in sorted(alternates):
+                nodes = []
+                node = p
+                while node not in position and node not in joins:
+                    nodes.append(node)
+                    node = previous[node]
+                join = position[node] if node in position else joins[node]
+                if join > i:
+                    break
+            else:
+                continue #no loop-free alternate, the controller reroutes the flow
+            backups[u] = self.adjacency[u][p]
+            for node in nodes:
+                detours.append((node, [(self.adjacency[node][previous[node]], distance[node])]))
+                joins[node] = join
+        return backups, detours
+
+    def add_ports_to_multipath(self, next_hops, dst, last_port): #Add the output ports to the next hops
+        # egress first: the switches are sorted by their distance to dst
+        distance = self.trees[dst][0]
+        p = [(dst, [(last_port, 0)])]
+        for s1 in sorted(next_hops, key=lambda s1: distance[s1]):
+            p.append((s1, [(self.adjacency[s1][s2], cost) for s2, cost in next_hops[s1]]))
+        return p
+
+    def install_path(self, src, first_port, dst, last_port, ip_src, ip_dst, msg=None): #This installs the path in terms of openflow rules 
+        if destination_forwarding:
+            # one rule per destination on every switch, whatever the source
+            self.install_destination(ip_dst, msg)
+            return first_port
+
+        # the same flow is already being installed, its packets wait for that setup
+        if self.coalesce_setup((ip_src, ip_dst), msg):
+            return first_port
+
+        # on large topologies a path which is not known yet is computed by the workers,
+        # the handler goes on and the installation continues once the result is back
+        if self.use_workers() and (not self.router.path_ready(src, dst) or self.missing_trees(src, dst)):
+            hub.spawn(self.install_path_later, src, first_port, dst, last_port, ip_src, ip_dst, msg)
+            return first_port
+
         computation_start = time.time()
+        self.installed_pairs[src, dst].add((ip_src, ip_dst))
+        if msg is not None:
+            # the switch sent the packet, so it does not have the rules the registry expects;
+            # they are sent again but their group is kept, the new rules use it too
+            self.stale_flows.add((msg.datapath.id, ip_src, ip_dst))
+        start = time.perf_counter_ns()
         path = self.get_path(src, dst)
+        self.timers['get_path'].record(time.perf_counter_ns() - start)
         pw = self.get_path_cost(path)
-        print ("Shortest path is", path, "with delay", pw, "ms.")
+        self.logger.debug("Shortest path is %s with delay %s ms.", path, pw)
+        start = time.perf_counter_ns()
         path_with_ports = self.add_ports_to_path(path, dst, first_port, last_port)
+        self.timers['add_ports_to_path'].record(time.perf_counter_ns() - start)
 
+        # output ports of every switch with the cost of the path through them, egress first
+        if multipath and src != dst:
+            switch_ports = self.add_ports_to_multipath(self.get_multipath(src, dst), dst, last_port)
+        else:
+            switch_ports = [(node[0], [(node[2], pw)]) for node in reversed(path_with_ports)]
+        backups = {}
+        if fast_failover and not multipath and src != dst:
+            backups, detours = self.get_backup_ports(path, dst)
+            switch_ports += detours
+            self.logger.debug("Backup next hops on %d of %d switches.", len(backups), len(path) - 1)
+
+        # the ingress switch is programmed only once all the others confirmed their rules,
+        # so that no packet of the flow can reach a switch which does not know it yet
+        setup = self.start_setup(PathSetup(src, dst, ip_src, ip_dst, msg))
+        setup.hops = len(path) - 1
+        setup.cookie = self.index_path(ip_src, ip_dst, switch_ports, backups)
+        for node, out_ports in switch_ports:
+            if node == src:
+                setup.ingress = out_ports
+                setup.backup = backups.get(src)
+                continue
+            # the switches whose rules did not change are not sent anything
+            if self.install_switch_rules(node, out_ports, src, dst, ip_src, ip_dst, backups.get(node), setup.cookie):
+                self.send_barrier(node, setup)
+            setup.switches.add(node)
+        if not setup.waiting:
+            self.install_ingress(setup)
+
+        self.logger.debug("Path installation from %s to %s started.", src, dst)
+        exec_time=round((time.time() - computation_start)*1000, 2)
+        self.logger.debug("Total execution time: %s ms.", exec_time)
+        self.logger.debug("The total control packet amount is: %d", self.pkt_count)
+        self.pkt_count=0
+        return path_with_ports[0][1]
 
-        for node in path_with_ports:
+    def install_path_later(self, src, first_port, dst, last_port, ip_src, ip_dst, msg):
+        if self.wait_path(src, dst):
+            self.wait_trees(self.missing_trees(src, dst))
+            self.install_path(src, first_port, dst, last_port, ip_src, ip_dst, msg)
+
+    def index_path(self, ip_src, ip_dst, switch_ports, backups): #cookie of the host path, indexed by the links it crosses
+        cookie = self.path_cookies.get((ip_src, ip_dst))
+        if cookie is None:
+            cookie = self.next_cookie
+            self.next_cookie += 1
+            self.path_cookies[ip_src, ip_dst] = cookie
+        else:
+            self.forget_path(cookie)
+
+        switches = set()
+        links = set()
+        for node, out_ports in switch_ports:
+            switches.add(node)
+            ports = set(port for port, cost in out_ports)
+            if node in backups:
+                ports.add(backups[node])
+            for p, port in self.adjacency[node].items():
+                if port in ports:
+                    links.add((node, p) if node < p else (p, node))
+        for link in links:
+            self.link_paths[link].add(cookie)
+        self.cookie_paths[cookie] = (ip_src, ip_dst, switches, links)
+        return cookie
+
+    def forget_path(self, cookie): #removes the path from the link index
+        for link in self.cookie_paths[cookie][3]:
+            self.link_paths[link].discard(cookie)
+            if not self.link_paths[link]:
+                del self.link_paths[link]
+
+    def invalidate_link(self, s1, s2): #removes and recomputes only the host paths crossing the link s1-s2
+        cookies = self.link_paths.get((s1, s2) if s1 < s2 else (s2, s1), set())
+        pairs = []
+        deleted = set()
+        for cookie in list(cookies):
+            ip_src, ip_dst, switches, links = self.cookie_paths[cookie]
+            if not fast_failover:
+                # with fast failover the switches already moved the flow to the backup ports
+                nodes = set(self.pair_flows[ip_src, ip_dst])
+                self.delete_pair_flows(ip_src, ip_dst, nodes)
+                deleted |= nodes
+            pairs.append((ip_src, ip_dst))
+        self.proactive_queue -= set(pairs)
+
+        # the switches may reorder the messages, the barrier makes them process the
+        # deletes before the rules of the new routes, which use the same cookies
+        for node in deleted:
+            dp = self.datapath_list.get(node)
+            if dp is not None:
+                dp.send_msg(dp.ofproto_parser.OFPBarrierRequest(dp))
+        for ip_src, ip_dst in pairs:
+            hosts = self.get_host_pair(ip_src, ip_dst)
+            if hosts is not None:
+                h1, h2 = hosts
+                self.install_path(h1[0], h1[1], h2[0], h2[1], ip_src, ip_dst)
+            else:
+                cookie = self.path_cookies.pop((ip_src, ip_dst))
+                self.forget_path(cookie)
+                del self.cookie_paths[cookie]
+        return len(pairs)
+
+    def record_flow(self, node, ip_src, ip_dst, actions, cookie): #True if the rules of the switch have to be sent
+        key = (node, ip_src, ip_dst)
+        if self.flow_registry.get(key) == (actions, cookie) and key not in self.stale_flows:
+            self.flowmods_avoided += 2
+            return False
+        self.stale_flows.discard(key)
+        self.expired_flows.pop(key, None)
+        self.flow_registry[key] = (actions, cookie)
+        self.pair_flows[ip_src, ip_dst].add(node)
+        self.switch_flows[node].add((ip_src, ip_dst))
+        return True
+
+    def forget_flow(self, node, ip_src, ip_dst): #the rules of the host pair are not on the switch anymore
+        entry = self.flow_registry.pop((node, ip_src, ip_dst), None)
+        self.stale_flows.discard((node, ip_src, ip_dst))
+        self.expired_flows.pop((node, ip_src, ip_dst), None)
+        if entry is not None:
+            self.pair_flows[ip_src, ip_dst].discard(node)
+            self.switch_flows[node].discard((ip_src, ip_dst))
+            self.release_group(node, entry[0])
+
+    def delete_pair_flows(self, ip_src, ip_dst, nodes): #removes the rules of the host pair from the switches
+        cookie = self.path_cookies[ip_src, ip_dst]
+        for node in nodes:
+            if node in self.datapath_list:
+                self.delete_path_flows(self.datapath_list[node], cookie)
+            self.forget_flow(node, ip_src, ip_dst)
+
+    def remove_stale_flows(self, setup): #the switches left by the new route of the pair lose its rules
+        cookie = self.path_cookies.get((setup.ip_src, setup.ip_dst))
+        if cookie != setup.cookie:
+            return
+        stale = self.pair_flows[setup.ip_src, setup.ip_dst] - self.cookie_paths[cookie][2]
+        if stale:
+            self.delete_pair_flows(setup.ip_src, setup.ip_dst, stale)
 
-            dp = self.datapath_list[int(node[0])]
-            ofp = dp.ofproto
-            ofp_parser = dp.ofproto_parser
+    def install_destination(self, ip_dst, msg=None): #forwarding towards ip_dst on the tree rooted in its switch
+        dst_mac = self.arp_table.get(ip_dst)
+        if dst_mac not in self.hosts:
+            return
+        if self.coalesce_setup((None, ip_dst), msg):
+            return
+        root, last_port = self.hosts[dst_mac]
+        if root not in self.datapath_list:
+            return
+        if root not in self.trees:
+            if self.use_workers():
+                # the rules are installed once the workers computed the tree
+                hub.spawn(self.install_destination_later, root, ip_dst, msg)
+                return
+            self.trees[root] = self.shortest_path_tree(root)
+        distance, previous = self.trees[root]
+
+        # with aggregation, the switches other than the egress one can share a
+        # prefix rule when the prefix is routed towards the same egress switch
+        prefix = None
+        if destination_prefix_len is not None:
+            prefix = self.get_prefix(ip_dst)
+            self.prefix_roots.setdefault(prefix, root)
+            if self.prefix_roots[prefix] != root:
+                prefix = None
+
+        setup = self.start_setup(PathSetup(None, root, None, ip_dst, msg))
+        setup.confirmed = True #no ingress switch, every rule is confirmed at once
+        if msg is not None and msg.datapath.id in distance:
+            setup.hops = len(self.path_from_tree(previous, root, msg.datapath.id)) - 1
+
+        # egress first: the switches are sorted by their distance to the destination
+        for node in sorted(distance, key=distance.get):
+            if node == root:
+                key = ip_dst
+                out_port = last_port
+            else:
+                key = prefix or ip_dst
+                out_port = self.adjacency[node][previous[node]]
+            setup.switches.add(node)
+            rules = self.destination_rules.setdefault(key, {})
+            if rules.get(node) == out_port:
+                continue #already forwarding on the right port
+            rules[node] = out_port
+            self.destination_roots[key] = root
+            self.install_destination_rule(node, key, out_port)
+            self.send_barrier(node, setup)
+
+        if not setup.waiting:
+            self.path_confirmed(setup)
+
+    def install_destination_later(self, root, ip_dst, msg):
+        self.wait_tree(root)
+        self.install_destination(ip_dst, msg)
+
+    def get_prefix(self, ip): #(network, mask) of the aggregation prefix of ip
+        mask = (0xffffffff << (32 - destination_prefix_len)) & 0xffffffff
+        network = struct.unpack('!I', socket.inet_aton(ip))[0] & mask
+        return (socket.inet_ntoa(struct.pack('!I', network)), socket.inet_ntoa(struct.pack('!I', mask)))
+
+    def install_destination_rule(self, node, key, out_port):
+        dp = self.datapath_list[int(node)]
+        ofp_parser = dp.ofproto_parser
+
+        # host rules win over the prefix rules which cover them
+        if isinstance(key, tuple):
+            priorities = (32767, 1)
+        else:
+            priorities = (32768, 2)
+        match_ip = ofp_parser.OFPMatch(eth_type=0x0800, ipv4_dst=key)
+        # only the replies: the requests still reach the controller, which learns their
+        # sender and answers them by proxy ARP
+        match_arp = ofp_parser.OFPMatch(eth_type=0x0806, arp_op=arp.ARP_REPLY, arp_tpa=key)
+        actions = [ofp_parser.OFPActionOutput(out_port)]
+        self.en_clear_flow_entry = True
+
+        # the cookie makes the switch notify the expiry of the rules, so that they are sent again
+        cookie = self.destination_cookies.get(key)
+        if cookie is None:
+            cookie = self.destination_cookies[key] = self.next_cookie
+            self.cookie_destinations[cookie] = key
+            self.next_cookie += 1
+        self.add_flow(dp, priorities[0], match_ip, actions, cookie=cookie)
+        self.add_flow(dp, priorities[1], match_arp, actions, cookie=cookie)
+
+    def reinstall_destinations(self, roots): #updates the destination rules of the trees rooted in roots
+        for key, root in list(self.destination_roots.items()):
+            if root in roots:
+                ip_dst = key if not isinstance(key, tuple) else None
+                if ip_dst is None:
+                    # a prefix is reinstalled through any of its hosts on the root switch
+                    for ip in self.arp_table:
+                        if self.get_prefix(ip) == key and self.hosts.get(self.arp_table[ip], (None,))[0] == root:
+                            ip_dst = ip
+                            break
+                if ip_dst is not None:
+                    self.install_destination(ip_dst)
+
+    def install_switch_rules(self, node, out_ports, src, dst, ip_src, ip_dst, backup_port=None, cookie=0): #sends the group and flow entries of one switch
+        dp = self.datapath_list[int(node)]
+        ofp = dp.ofproto
+        ofp_parser = dp.ofproto_parser
+
+        # hashable form of the actions, nothing is sent when the switch already has them;
+        # the group rules are (group type, src, dst, (port, bucket weight)...)
+        if len(out_ports) > 1:
+            # bucket weights are inversely proportional to the cost of the path through the port
+            min_weight = min(weight for port, weight in out_ports)
+            rule = (ofp.OFPGT_SELECT, src, dst,
+                    tuple((port, max(1, int(round(min_weight / weight * 10)))) for port, weight in out_ports))
+        elif len(out_ports) == 1 and backup_port is not None:
+            # the first bucket whose port is live forwards the packets, so the switch
+            # moves the flow to the backup port as soon as the primary one goes down
+            rule = (ofp.OFPGT_FF, src, dst, ((out_ports[0][0], 0), (backup_port, 0)))
+        elif len(out_ports) == 1:
+            rule = (out_ports[0][0],)
+        else:
+            return False
+        old = self.flow_registry.get((node, ip_src, ip_dst))
+        if not self.record_flow(node, ip_src, ip_dst, rule, cookie):
+            return False
 
-            ports = defaultdict(list)
-            actions = []
+        if len(rule) > 1:
+            actions = [ofp_parser.OFPActionGroup(self.acquire_group(dp, rule))]
+        else:
+            actions = [ofp_parser.OFPActionOutput(rule[0])]
+        self.send_path_flows(dp, ip_src, ip_dst, actions, cookie)
+
+        # the group of the old rule may not be used anymore
+        if old is not None:
+            self.release_group(node, old[0])
+        return True
+
+    def send_path_flows(self, dp, ip_src, ip_dst, actions, cookie): #IPv4 and ARP entries of a host pair on one switch
+        ofp_parser = dp.ofproto_parser
+        match_ip = ofp_parser.OFPMatch(
+            eth_type=0x0800, 
+            ipv4_src=ip_src, 
+            ipv4_dst=ip_dst
+        )
+        match_arp = ofp_parser.OFPMatch(
+            eth_type=0x0806, 
+            arp_spa=ip_src, 
+            arp_tpa=ip_dst
+        )
+        self.en_clear_flow_entry = True
+
+        self.add_flow(dp, 32768, match_ip, actions, cookie=cookie)
+        self.add_flow(dp, 1, match_arp, actions, cookie=cookie)
+
+    def acquire_group(self, datapath, rule): #id of the group of the rule, created or updated on the switch if needed
+        ofp = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
 
-            
-            in_port = node[1]
-            out_port = node[2]
-            if (out_port, pw) not in ports[in_port]:
-                ports[in_port].append((out_port, pw))
-                
+        # the flows between the same switches share the group of each switch
+        key = (datapath.id,) + rule[:3]
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = [self.allocate_group_id(datapath.id), 0, None]
+            command = ofp.OFPGC_ADD
+        else:
+            command = ofp.OFPGC_MODIFY
 
-            for in_port in ports:
-
-                match_ip = ofp_parser.OFPMatch(
-                    eth_type=0x0800, 
-                    ipv4_src=ip_src, 
-                    ipv4_dst=ip_dst
-                )
-                match_arp = ofp_parser.OFPMatch(
-                    eth_type=0x0806, 
-                    arp_spa=ip_src, 
-                    arp_tpa=ip_dst
-                )
-
-                out_ports = ports[in_port]
-
-                if len(out_ports) > 1:
-                    group_id = None
-                    group_new = False
-
-                    if (node, src, dst) not in self.multipath_group_ids:
-                        group_new = True
-                        self.multipath_group_ids[
-                            node, src, dst] = self.generate_openflow_gid()
-                    group_id = self.multipath_group_ids[node, src, dst]
-
-                    buckets = []
-                    for port, weight in out_ports:
-                        bucket_weight = int(round((1 - weight/pw) * 10))
-                        bucket_action = [ofp_parser.OFPActionOutput(port)]
-                        buckets.append(
-                            ofp_parser.OFPBucket(
-                                weight=bucket_weight,
-                                watch_port=port,
-                                watch_group=ofp.OFPG_ANY,
-                                actions=bucket_action
-                            )
-                        )
-
-                    if group_new:
-                        req = ofp_parser.OFPGroupMod(
-                            dp, ofp.OFPGC_ADD, ofp.OFPGT_SELECT, group_id,
-                            buckets
-                        )
-                        dp.send_msg(req)
-                        
-                    else:
-                        req = ofp_parser.OFPGroupMod(
-                            dp, ofp.OFPGC_MODIFY, ofp.OFPGT_SELECT,
-                            group_id, buckets)
-                        dp.send_msg(req)
-
-                    actions = [ofp_parser.OFPActionGroup(group_id)]
-                    self.en_clear_flow_entry = True
-
-                    self.add_flow(dp, 32768, match_ip, actions)
-                    self.add_flow(dp, 1, match_arp, actions)
-
-                elif len(out_ports) == 1:
-                    actions = [ofp_parser.OFPActionOutput(out_ports[0][0])]
-                    self.en_clear_flow_entry = True
-
-                    self.add_flow(dp, 32768, match_ip, actions)
-                    self.add_flow(dp, 1, match_arp, actions)
-        print ("Path installation from", src, "to", dst, "finished.")
-        exec_time=round((time.time() - computation_start)*1000, 2)
-        print ("Total execution time:",exec_time,"ms.")
-        print("The total control packet amount is:", self.pkt_count)
-        print("")
-        self.pkt_count=0
-        return path_with_ports[0][1]
+        if group[2] != rule[3]:
+            datapath.send_msg(ofp_parser.OFPGroupMod(datapath, command, rule[0], group[0], self.group_buckets(datapath, rule[3])))
+            group[2] = rule[3]
+        group[1] += 1 #one more flow rule uses it
+        return group[0]
+
+    def group_buckets(self, datapath, buckets): #OpenFlow buckets of the (port, weight) pairs of a group rule
+        ofp = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
+        return [ofp_parser.OFPBucket(weight=weight, watch_port=port, watch_group=ofp.OFPG_ANY,
+                                     actions=[ofp_parser.OFPActionOutput(port)])
+                for port, weight in buckets]
+
+    def release_group(self, node, rule): #the group is deleted from the switch when no flow rule uses it anymore
+        if len(rule) == 1:
+            return #plain output, no group
+        key = (node,) + rule[:3]
+        group = self.groups.get(key)
+        if group is None:
+            return
+        group[1] -= 1
+        if group[1] > 0:
+            return
+        del self.groups[key]
+        dp = self.datapath_list.get(node)
+        if dp is not None:
+            dp.send_msg(dp.ofproto_parser.OFPGroupMod(dp, dp.ofproto.OFPGC_DELETE, rule[0], group[0]))
+        self.group_free[node].append(group[0])
+
+    def allocate_group_id(self, dpid): #O(1) group id of the switch, the released ids are reused first
+        free = self.group_free[dpid]
+        if free:
+            return free.pop()
+        self.group_next[dpid] = self.group_next.get(dpid, 0) + 1
+        return self.group_next[dpid]
+
+    def send_barrier(self, node, setup): #the barrier reply confirms that all the previous messages have been processed
+        dp = self.datapath_list[int(node)]
+        req = dp.ofproto_parser.OFPBarrierRequest(dp)
+        dp.set_xid(req)
+        dp.send_msg(req)
+        setup.waiting.add((dp.id, req.xid))
+        self.pending_barriers[dp.id, req.xid] = setup
+
+    def install_ingress(self, setup): #downstream rules are confirmed, the ingress switch can be programmed
+        setup.confirmed = True
+        if setup.ingress is not None and setup.src not in self.datapath_list:
+            # the ingress switch left while the downstream switches were programmed
+            self.abort_setup(setup)
+            return
+        sent = False
+        if setup.ingress is not None:
+            sent = self.install_switch_rules(setup.src, setup.ingress, setup.src, setup.dst, setup.ip_src, setup.ip_dst,
+                                             setup.backup, setup.cookie)
+            setup.switches.add(setup.src)
+        if sent:
+            self.send_barrier(setup.src, setup)
+        else:
+            self.path_confirmed(setup)
+
+    def coalesce_setup(self, key, msg): #True if the packet-in joined a setup of the same flow still in flight
+        setup = self.inflight_setups.get(key)
+        if setup is None or setup.changed_at != self.topology_changed_at:
+            return False #nothing in flight, or computed on a topology which changed since
+        if time.time() - setup.started > setup_timeout:
+            return False #some barrier reply got lost
+        if msg is not None:
+            setup.queued.append(msg)
+        self.setups_coalesced += 1
+        return True
+
+    def start_setup(self, setup):
+        setup.changed_at = self.topology_changed_at
+        self.inflight_setups[setup.ip_src, setup.ip_dst] = setup
+        return setup
+
+    def path_confirmed(self, setup): #every switch of the path has its rules, the packets which triggered it can go
+        key = (setup.ip_src, setup.ip_dst)
+        if self.inflight_setups.get(key) is setup:
+            del self.inflight_setups[key]
+        if setup.cookie:
+            # the packets follow the new route now, the old one can go
+            self.remove_stale_flows(setup)
+
+        for msg in [setup.msg] + setup.queued:
+            if msg is None or msg.datapath.id not in setup.switches:
+                continue
+            # the packet goes through the flow table again, which now forwards it along the path
+            self.resubmit_packet(msg)
+
+            # each downstream switch would have sent it to the controller again without its rule
+            self.packet_ins_avoided += setup.hops
+        if setup.src is None:
+            self.logger.debug("Forwarding towards %s confirmed in %.2f ms.",
+                              setup.ip_dst, (time.time() - setup.started)*1000)
+        else:
+            self.logger.debug("Path installation from %s to %s confirmed in %.2f ms.",
+                              setup.src, setup.dst, (time.time() - setup.started)*1000)
+
+    def abort_setup(self, setup): #a switch of the path left, the setup is given up
+        key = (setup.ip_src, setup.ip_dst)
+        if self.inflight_setups.get(key) is setup:
+            del self.inflight_setups[key]
+        for key in setup.waiting:
+            self.pending_barriers.pop(key, None)
+        setup.waiting.clear()
+
+        # the ingress has no rule for them yet, the packets come back as packet-ins
+        # and start a new setup on the topology without the switch
+        for msg in [setup.msg] + setup.queued:
+            if msg is not None and self.datapaths.get(msg.datapath.id) is msg.datapath:
+                self.resubmit_packet(msg)
+        self.logger.debug("Path installation from %s to %s aborted after %.2f ms.",
+                          setup.src, setup.dst, (time.time() - setup.started)*1000)
+
+    def resubmit_packet(self, msg): #sends the packet of a packet-in through the flow table of its switch
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
+        actions = [ofp_parser.OFPActionOutput(ofproto.OFPP_TABLE)]
+        data = None
+        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
+            data = msg.data
+        out = ofp_parser.OFPPacketOut(
+            datapath=datapath, buffer_id=msg.buffer_id, in_port=msg.match['in_port'],
+            actions=actions, data=data)
+        datapath.send_msg(out)
 
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None): #Add the flow in the openflow table
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def _barrier_reply_handler(self, ev):
+        key = (ev.msg.datapath.id, ev.msg.xid)
+        setup = self.pending_barriers.pop(key, None)
+        if setup is None:
+            return
+        setup.waiting.discard(key)
+        if setup.waiting:
+            return
+        if setup.confirmed:
+            self.path_confirmed(setup)
+        else:
+            self.install_ingress(setup)
 
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None, cookie=0): #Add the flow in the openflow table
+        start = time.perf_counter_ns()
         ofproto = datapath.ofproto
         ofp_parser = datapath.ofproto_parser
 
         inst = [ofp_parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
                                              actions)]
+        # the expiry of a path rule is notified, so that the registry forgets it
+        flags = ofproto.OFPFF_SEND_FLOW_REM if cookie else 0
         if buffer_id:
             if(self.en_clear_flow_entry):
-                mod = ofp_parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
+                mod = ofp_parser.OFPFlowMod(datapath=datapath, cookie=cookie, buffer_id=buffer_id,
                                     priority=priority, match=match,idle_timeout=idle_time,
-                                    instructions=inst)
+                                    flags=flags, instructions=inst)
             else:
-                mod = ofp_parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
+                mod = ofp_parser.OFPFlowMod(datapath=datapath, cookie=cookie, buffer_id=buffer_id,
                                     priority=priority, match=match,
-                                    instructions=inst)
+                                    flags=flags, instructions=inst)
         else:
             if(self.en_clear_flow_entry):
-                mod = ofp_parser.OFPFlowMod(datapath=datapath, priority=priority,
+                mod = ofp_parser.OFPFlowMod(datapath=datapath, cookie=cookie, priority=priority,
                                     match=match, idle_timeout=idle_time,
-                                    instructions=inst)
+                                    flags=flags, instructions=inst)
             else:
-                mod = ofp_parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                    match=match,instructions=inst)
+                mod = ofp_parser.OFPFlowMod(datapath=datapath, cookie=cookie, priority=priority,
+                                    match=match, flags=flags, instructions=inst)
         datapath.send_msg(mod)
+        self.flowmods_sent += 1
+        self.timers['flow_mod'].record(time.perf_counter_ns() - start)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev): #an idle path rule expired, it is sent again by the next installation
+        msg = ev.msg
+        if msg.reason == msg.datapath.ofproto.OFPRR_DELETE:
+            return #removed by the controller, which already knows
+        key = self.cookie_destinations.get(msg.cookie)
+        if key is not None:
+            # the switch does not forward towards the destination anymore, whichever entry expired
+            self.destination_rules.get(key, {}).pop(msg.datapath.id, None)
+            return
+        path = self.cookie_paths.get(msg.cookie)
+        if path is None:
+            return
+        key = (msg.datapath.id, path[0], path[1])
+        if key not in self.flow_registry:
+            return
+
+        # the ARP entry of a pair idles out first during a long flow, the pair and its group
+        # are only forgotten once both entries expired; until then the next installation
+        # sends the missing entry again
+        expired = self.expired_flows.setdefault(key, set())
+        expired.add(msg.match.get('eth_type'))
+        if len(expired) < 2:
+            self.stale_flows.add(key)
+            return
+        self.forget_flow(*key)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER) #General switch behaviour definition
     def _switch_features_handler(self, ev): 
         datapath = ev.msg.datapath
+
+        # the tables survive a reconnection of the switch and a restart of the controller,
+        # they are compared with the intended state instead of being wiped; the table-miss
+        # entry is sent by the reconciliation too, when the switch misses it
+        self.start_reconciliation(datapath)
+
+    def install_table_miss(self, datapath): #sends the unmatched packets to the controller, the entry never expires
         ofproto = datapath.ofproto
         ofp_parser = datapath.ofproto_parser
 
         match = ofp_parser.OFPMatch()
         actions = [ofp_parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
                                           ofproto.OFPCML_NO_BUFFER)]
+        self.en_clear_flow_entry = False
         self.add_flow(datapath, 0, match, actions)
-        self.match_miss_flow_entry = match
-        self.actions_miss_flow_entry = actions
+
+    def start_reconciliation(self, datapath): #asks the flow and group tables of the switch
+        ofp_parser = datapath.ofproto_parser
+        # the destination rules are not reconciled, they are sent again
+        for rules in self.destination_rules.values():
+            rules.pop(datapath.id, None)
+        self.reconciling[datapath.id] = Reconciliation(datapath)
+        datapath.send_msg(ofp_parser.OFPFlowStatsRequest(datapath, table_id=0))
+        datapath.send_msg(ofp_parser.OFPGroupDescStatsRequest(datapath))
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        self.reconciliation_reply(ev.msg, 'flows')
+
+    @set_ev_cls(ofp_event.EventOFPGroupDescStatsReply, MAIN_DISPATCHER)
+    def _group_desc_stats_reply_handler(self, ev):
+        self.reconciliation_reply(ev.msg, 'groups')
+
+    def reconciliation_reply(self, msg, table): #the switch is reconciled once both tables are complete
+        reconciliation = self.reconciling.get(msg.datapath.id)
+        if reconciliation is None or reconciliation.datapath is not msg.datapath:
+            return #reply to an older connection
+        getattr(reconciliation, table).extend(msg.body)
+        if msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            return #the table is split over several replies
+        reconciliation.waiting.discard(table)
+        if not reconciliation.waiting:
+            del self.reconciling[msg.datapath.id]
+            self.reconcile_switch(reconciliation)
+
+    def reconcile_switch(self, reconciliation): #sends only the missing and stale entries, and deletes the orphans
+        datapath = reconciliation.datapath
+        dpid = datapath.id
+        ofproto = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
+
+        # groups first, the flow entries pushed below may use them
+        installed = {}
+        for stat in reconciliation.groups:
+            buckets = tuple((bucket.actions[0].port if bucket.actions else None, bucket.weight) for bucket in stat.buckets)
+            installed[stat.group_id] = (stat.type, buckets)
+        flood = installed.pop(FLOOD_GROUP_ID, None)
+        groups_sent = 0
+        for key, group in self.groups.items():
+            if key[0] != dpid:
+                continue
+            current = installed.pop(group[0], None)
+            if current == (key[1], group[2]):
+                continue
+            command = ofproto.OFPGC_ADD if current is None else ofproto.OFPGC_MODIFY
+            datapath.send_msg(ofp_parser.OFPGroupMod(datapath, command, key[1], group[0], self.group_buckets(datapath, group[2])))
+            groups_sent += 1
+
+        # path entries (nonzero cookie) by host pair, and the in ports of the broadcast rules
+        found = {}
+        flood_ports = set()
+        table_miss = False
+        for stat in reconciliation.flows:
+            match = stat.match
+            if stat.priority == 0 and not match.items():
+                # an expiring table-miss entry would stop the packet-ins of the switch
+                table_miss = (not stat.idle_timeout and not stat.hard_timeout and
+                              self.stat_action(stat) == ('output', ofproto.OFPP_CONTROLLER))
+            elif stat.priority == FLOOD_PRIORITY and 'in_port' in match:
+                flood_ports.add(match['in_port'])
+            elif not stat.cookie:
+                continue #table-miss and IPv6 rules
+            elif stat.cookie in self.cookie_destinations:
+                continue #destination rules, sent again
+            elif match.get('eth_type') == ether_types.ETH_TYPE_IP and 'ipv4_src' in match:
+                found['ip', match['ipv4_src'], match['ipv4_dst']] = stat
+            elif match.get('eth_type') == ether_types.ETH_TYPE_ARP and 'arp_spa' in match:
+                found['arp', match['arp_spa'], match['arp_tpa']] = stat
+
+        pushed = 0
+        kept = 0
+        for ip_src, ip_dst in list(self.switch_flows.get(dpid, ())):
+            rule, cookie = self.flow_registry[dpid, ip_src, ip_dst]
+            action = self.rule_action(dpid, rule)
+            entries = [found.pop((kind, ip_src, ip_dst), None) for kind in ('ip', 'arp')]
+            if action is None:
+                # its group is unknown, the next packet of the pair reinstalls it
+                self.forget_flow(dpid, ip_src, ip_dst)
+                found.update((key, stat) for key, stat in zip((('ip', ip_src, ip_dst), ('arp', ip_src, ip_dst)), entries)
+                             if stat is not None)
+                continue
+            # both entries are kept or pushed below, the switch has them all again
+            self.expired_flows.pop((dpid, ip_src, ip_dst), None)
+            self.stale_flows.discard((dpid, ip_src, ip_dst))
+            if all(stat is not None and (stat.cookie, self.stat_action(stat)) == (cookie, action) for stat in entries):
+                kept += 1
+                continue
+            if action[0] == 'group':
+                actions = [ofp_parser.OFPActionGroup(action[1])]
+            else:
+                actions = [ofp_parser.OFPActionOutput(action[1])]
+            self.send_path_flows(datapath, ip_src, ip_dst, actions, cookie)
+            pushed += 1
+
+        if not table_miss:
+            self.install_table_miss(datapath)
+
+        # what is left is not intended anymore
+        for stat in found.values():
+            mod = ofp_parser.OFPFlowMod(datapath=datapath, command=ofproto.OFPFC_DELETE_STRICT,
+                                        priority=stat.priority, match=stat.match,
+                                        out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY)
+            datapath.send_msg(mod)
+        for group_id in installed:
+            datapath.send_msg(ofp_parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE, 0, group_id))
+
+        # the broadcast tree is updated from what the switch really has, its
+        # broadcast rules left without the flood group are deleted with the next update
+        tree_ports = frozenset(flood_ports)
+        if flood is None:
+            self.flood_groups.discard(dpid)
+            edge_ports = frozenset()
+        else:
+            self.flood_groups.add(dpid)
+            edge_ports = frozenset(port for port, weight in flood[1]) - tree_ports
+        if tree_ports or edge_ports:
+            self.flood_ports[dpid] = (tree_ports, edge_ports)
+        else:
+            self.flood_ports.pop(dpid, None)
+        self.flood_tree_dirty = True
+
+        self.logger.info("Switch %s reconciled in %.1f ms: %d path rules kept, %d pushed, %d groups pushed, "
+                         "table-miss %s, %d orphan flow entries and %d orphan groups deleted.", dpid,
+                         (time.time() - reconciliation.started) * 1000, kept, pushed, groups_sent,
+                         'kept' if table_miss else 'pushed', len(found), len(installed))
+
+    def stat_action(self, stat): #('output', port) or ('group', group id) of a flow entry, as rule_action
+        for instruction in stat.instructions:
+            for action in getattr(instruction, 'actions', ()):
+                if action.cls_action_type == ofproto_v1_3.OFPAT_OUTPUT:
+                    return ('output', action.port)
+                if action.cls_action_type == ofproto_v1_3.OFPAT_GROUP:
+                    return ('group', action.group_id)
+        return None
+
+    def rule_action(self, dpid, rule): #action of the flow entries of a rule of the registry
+        if len(rule) == 1:
+            return ('output', rule[0])
+        group = self.groups.get((dpid,) + rule[:3])
+        return ('group', group[0]) if group is not None else None
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER) #Behaviour when a packet arrives in a generic switch 
     def _packet_in_handler(self, ev):
-        msg = ev.msg
+        start = time.perf_counter_ns()
+        try:
+            self.handle_packet_in(ev.msg)
+        finally:
+            self.timers['packet_in'].record(time.perf_counter_ns() - start)
+
+    def handle_packet_in(self, msg):
         datapath = msg.datapath
-        ofproto = datapath.ofproto
-        ofp_parser = datapath.ofproto_parser
-        in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        arp_pkt = pkt.get_protocol(arp.arp)
+        # the few fields needed are read straight from the frame, without
+        # building the ryu packet objects; the ethertype alone sorts out the
+        # frames which are not decoded further
+        data = msg.data
+        if len(data) < 14:
+            return
+        ethertype = ETH_TYPE.unpack_from(data, 12)[0]
 
         # avoid broadcast from LLDP
-        if eth.ethertype == 35020:
+        if ethertype == ether_types.ETH_TYPE_LLDP:
+            return
+        if ethertype == PROBE_ETH_TYPE:
+            self.link_probe_received(datapath.id, data)
             return
         if self.disable_packet_in :
             return
 
-        #this avoids ipv4 duplicates
-        if pkt.get_protocol(ipv4.ipv4):  
-            match = ofp_parser.OFPMatch(eth_type=eth.ethertype)
-            src_ip = pkt.get_protocol(ipv4.ipv4).src
-            dst_ip = pkt.get_protocol(ipv4.ipv4).dst
-            
-            dst = eth.dst       
-            src = eth.src
-            dpid = datapath.id
-            self.arp_table[src_ip] = src
-            h1 = self.hosts[src]        
-            h2 = self.hosts[dst]   
-            out_port = self.install_path(h1[0], h1[1], h2[0], h2[1], src_ip, dst_ip)
-            out_port = self.install_path(h2[0], h2[1], h1[0], h1[1], dst_ip, src_ip)
-            print("")  
-            return
+        ofproto = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
 
-        if pkt.get_protocol(ipv6.ipv6):  # Drop the IPV6 Packets.
-            match = ofp_parser.OFPMatch(eth_type=eth.ethertype)
+        if ethertype == ether_types.ETH_TYPE_IPV6:  # Drop the IPV6 Packets.
+            match = ofp_parser.OFPMatch(eth_type=ethertype)
             actions = []
             self.en_clear_flow_entry = False
             self.add_flow(datapath, 1, match, actions)
             return None
 
-        dst = eth.dst
-        src = eth.src
+        start = time.perf_counter_ns()
+        dst, src, opcode, src_ip, dst_ip = parse_frame(data, ethertype)
+        self.timers['parse'].record(time.perf_counter_ns() - start)
+        in_port = msg.match['in_port']
+
+        #this avoids ipv4 duplicates
+        if ethertype == ether_types.ETH_TYPE_IP and src_ip is not None:
+            self.learn_arp(src_ip, src)
+            h1 = self.hosts.get(src)
+            h2 = self.hosts.get(dst)
+            if h1 is not None and h2 is not None:
+                self.install_path(h1[0], h1[1], h2[0], h2[1], src_ip, dst_ip, msg)
+                self.install_path(h2[0], h2[1], h1[0], h1[1], dst_ip, src_ip)
+                return
+            # a host the controller never saw, the packet is flooded
+
         dpid = datapath.id
 
         if src not in self.hosts:
@@ -347,75 +1685,351 @@ class ProjectController(app_manager.RyuApp):
 
         out_port = ofproto.OFPP_FLOOD
 
-        if arp_pkt:
+        if ethertype == ether_types.ETH_TYPE_ARP and opcode is not None:
             self.pkt_count+=1
-            src_ip = arp_pkt.src_ip
-            dst_ip = arp_pkt.dst_ip
-            if arp_pkt.opcode == arp.ARP_REPLY:
-                self.arp_table[src_ip] = src
+            self.learn_arp(src_ip, src)
+            if dst == CONTROLLER_MAC:
+                return #answer to a refresh of the ARP cache
+
+            if opcode == arp.ARP_REPLY and dst in self.hosts:
                 h1 = self.hosts[src]
                 h2 = self.hosts[dst]
-                out_port = self.install_path(h1[0], h1[1], h2[0], h2[1], src_ip, dst_ip)
+                self.install_path(h1[0], h1[1], h2[0], h2[1], src_ip, dst_ip, msg)
                 self.install_path(h2[0], h2[1], h1[0], h1[1], dst_ip, src_ip) # reverse
-                
-            elif arp_pkt.opcode == arp.ARP_REQUEST:
-                if dst_ip in self.arp_table:
-                    self.arp_table[src_ip] = src
+                return #the reply is sent by the path installation once it is confirmed
+
+            elif opcode == arp.ARP_REQUEST:
+                if dst_ip in self.arp_table and dst_ip != src_ip:
+                    if in_port in self.link_ports[dpid]:
+                        return #copy of a request flooded before the target was known
+                    # the request comes from the host itself, which may have moved since it was learned
+                    self.hosts[src] = (dpid, in_port)
+                    # proxy ARP: the controller answers for the known target, nothing is flooded
                     dst_mac = self.arp_table[dst_ip]
+                    self.send_arp_reply(datapath, in_port, src, src_ip, dst_mac, dst_ip)
+                    self.arp_proxied += 1
                     h1 = self.hosts[src]
-                    h2 = self.hosts[dst_mac]
-                    out_port = self.install_path(h1[0], h1[1], h2[0], h2[1], src_ip, dst_ip)
-                    self.install_path(h2[0], h2[1], h1[0], h1[1], dst_ip, src_ip) # reverse
+                    h2 = self.hosts.get(dst_mac)
+                    if h2 is not None:
+                        self.install_path(h1[0], h1[1], h2[0], h2[1], src_ip, dst_ip)
+                        self.install_path(h2[0], h2[1], h1[0], h1[1], dst_ip, src_ip) # reverse
+                    return
 
 
-        actions = [ofp_parser.OFPActionOutput(out_port)]
+        # flooding follows the broadcast tree once its group is on the switch
+        if dpid in self.flood_groups:
+            actions = [ofp_parser.OFPActionGroup(FLOOD_GROUP_ID)]
+        else:
+            actions = [ofp_parser.OFPActionOutput(out_port)]
 
-        data = None
-        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
-            data = msg.data
+        if msg.buffer_id != ofproto.OFP_NO_BUFFER:
+            data = None
 
         out = ofp_parser.OFPPacketOut(
             datapath=datapath, buffer_id=msg.buffer_id, in_port=in_port,
             actions=actions, data=data)
         datapath.send_msg(out)
 
+    def learn_arp(self, ip, mac): #adds or refreshes an entry of the ARP cache
+        self.arp_table[ip] = mac
+        self.arp_seen[ip] = time.time()
+
+    def send_arp_reply(self, datapath, port, req_mac, req_ip, mac, ip): #ARP reply on behalf of the host owning ip
+        ofproto = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
+        data = build_arp(arp.ARP_REPLY, mac, ip, req_mac, req_ip)
+        actions = [ofp_parser.OFPActionOutput(port)]
+        out = ofp_parser.OFPPacketOut(
+            datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+            in_port=ofproto.OFPP_CONTROLLER, actions=actions, data=data)
+        datapath.send_msg(out)
+
+    def _age_arp_table(self): #removes the old ARP entries, and asks the hosts to confirm the ones about to expire
+        while True:
+            hub.sleep(arp_aging_interval)
+            now = time.time()
+            for ip, seen in list(self.arp_seen.items()):
+                age = now - seen
+                if age >= arp_timeout:
+                    del self.arp_seen[ip]
+                    self.arp_table.pop(ip, None)
+                    self.logger.debug("The ARP entry of %s expired.", ip)
+                elif age >= arp_refresh_time:
+                    host = self.hosts.get(self.arp_table.get(ip))
+                    if host is not None and host[0] in self.datapath_list:
+                        # ARP probe (sender IP 0.0.0.0), the host answers to the controller MAC
+                        datapath = self.datapath_list[host[0]]
+                        ofproto = datapath.ofproto
+                        ofp_parser = datapath.ofproto_parser
+                        data = build_arp(arp.ARP_REQUEST, CONTROLLER_MAC, '0.0.0.0', '00:00:00:00:00:00', ip,
+                                         self.arp_table[ip])
+                        actions = [ofp_parser.OFPActionOutput(host[1])]
+                        out = ofp_parser.OFPPacketOut(
+                            datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+                            in_port=ofproto.OFPP_CONTROLLER, actions=actions, data=data)
+                        datapath.send_msg(out)
+
+    def _save_snapshots(self): #saves the state periodically, when it changed
+        saved = None
+        while True:
+            hub.sleep(snapshot_interval)
+            marker = (self.flowmods_sent, self.next_cookie, len(self.flow_registry), len(self.groups),
+                      len(self.hosts), len(self.arp_table), len(self.links))
+            if marker == saved:
+                continue
+            start = time.time()
+            try:
+                self.save_snapshot(CONF.snapshot_file)
+            except (IOError, OSError) as e:
+                self.logger.error("The snapshot could not be saved in %s: %s", CONF.snapshot_file, e)
+                continue
+            saved = marker
+            self.logger.debug("Snapshot of %d path rules saved in %.1f ms.", len(self.flow_registry),
+                              (time.time() - start) * 1000)
+
+    def save_snapshot(self, path):
+        links = [(u, v, port) for u in self.adjacency for v, port in self.adjacency[u].items() if port is not None]
+        arp_entries = dict((ip, (mac, self.arp_seen.get(ip, 0))) for ip, mac in self.arp_table.items())
+        groups = dict((key, group[0]) for key, group in self.groups.items())
+        snapshot.save(path, self.hosts, arp_entries, links, self.path_cookies, self.flow_registry, groups,
+                      self.destination_cookies, self.next_cookie)
+
+    def restore_snapshot(self, path): #state of the previous run, the switches are checked when they connect
+        state = snapshot.load(path)
+        if state is None:
+            return
+        self.hosts.update(state['hosts'])
+        for ip, (mac, seen) in state['arp'].items():
+            self.arp_table[ip] = mac
+            self.arp_seen[ip] = seen
+
+        # the links are used until LLDP finds them again, the ones it does not find are removed
+        self.restored_at = time.time()
+        for u, v, port in state['links']:
+            self.adjacency[u][v] = port
+            self.links.append(restored_port(u, port))
+            self.link_ports[u].add(port)
+            self.get_link_id(u, v)
+            self.restored_links.add((u, v))
+        if self.restored_links:
+            self.restored_links_thread = hub.spawn(self._expire_restored_links)
+
+        # flow rules, with the groups they use
+        group_ids = state['groups']
+        for (dpid, ip_src, ip_dst), (rule, cookie) in state['flows'].items():
+            if len(rule) > 1:
+                key = (dpid,) + rule[:3]
+                if key not in group_ids:
+                    continue
+                group = self.groups.setdefault(key, [group_ids[key], 0, rule[3]])
+                group[1] += 1
+            self.flow_registry[dpid, ip_src, ip_dst] = (rule, cookie)
+            self.pair_flows[ip_src, ip_dst].add(dpid)
+            self.switch_flows[dpid].add((ip_src, ip_dst))
+        for (dpid, gtype, src, dst), group in self.groups.items():
+            self.group_next[dpid] = max(self.group_next.get(dpid, 0), group[0])
+        used = set((key[0], group[0]) for key, group in self.groups.items())
+        for dpid, last in self.group_next.items():
+            self.group_free[dpid] = [i for i in range(last, 0, -1) if (dpid, i) not in used]
+
+        # the destination rules may still be on the switches, the new cookies must not reuse theirs
+        for key, cookie in state['destinations'].items():
+            self.destination_cookies[key] = cookie
+            self.cookie_destinations[cookie] = key
+        self.next_cookie = max(self.next_cookie, state['next_cookie'])
+
+        # host paths and the links they cross
+        for (ip_src, ip_dst), cookie in state['paths'].items():
+            self.path_cookies[ip_src, ip_dst] = cookie
+            self.next_cookie = max(self.next_cookie, cookie + 1)
+            switches = set(self.pair_flows.get((ip_src, ip_dst), ()))
+            links = set()
+            for node in switches:
+                rule = self.flow_registry[node, ip_src, ip_dst][0]
+                ports = set([rule[0]]) if len(rule) == 1 else set(port for port, weight in rule[3])
+                for p, port in self.adjacency[node].items():
+                    if port in ports:
+                        links.add((node, p) if node < p else (p, node))
+            for link in links:
+                self.link_paths[link].add(cookie)
+            self.cookie_paths[cookie] = (ip_src, ip_dst, switches, links)
+            h1 = self.hosts.get(self.arp_table.get(ip_src))
+            h2 = self.hosts.get(self.arp_table.get(ip_dst))
+            if h1 is not None and h2 is not None:
+                self.installed_pairs[h1[0], h2[0]].add((ip_src, ip_dst))
+
+        # the switches are reconciled with these rules when they connect
+        self.logger.info("Snapshot of %s restored: %d hosts, %d links, %d host paths, %d path rules on %d switches.",
+                         time.ctime(state['saved']), len(state['hosts']), len(state['links']) // 2,
+                         len(state['paths']), len(self.flow_registry), len(self.switch_flows))
+
+    def _expire_restored_links(self): #the restored links which LLDP did not find again are removed
+        while self.restored_links:
+            hub.sleep(restored_link_timeout)
+            self.expire_restored_links(time.time())
+
+    def expire_restored_links(self, now):
+        for u, v in list(self.restored_links):
+            if (u, v) not in self.restored_links:
+                continue
+            # both switches had the time to send their LLDP frames, a switch which
+            # did not reconnect since the restore is not coming back with the link
+            entered = [self.switch_entered_at.get(dpid, self.restored_at) for dpid in (u, v)]
+            if now - max(entered) < restored_link_timeout:
+                continue
+            self.restored_links.discard((u, v))
+            self.restored_links.discard((v, u))
+            self.logger.debug("The restored link from s%s to s%s was not found again.", u, v)
+            port = self.adjacency[u].get(v)
+            if port is not None:
+                self.remove_link(restored_port(u, port), restored_port(v, self.adjacency[v].get(u)))
+
+    def get_spanning_tree(self): #minimum spanning tree (forest) of the switches, Kruskal on the link costs
+        edges = []
+        for u in self.datapath_list:
+            for v, w in self.get_neighbours(u):
+                if u < v:
+                    edges.append((w, u, v))
+        edges.sort()
+
+        parent = dict((u, u) for u in self.datapath_list)
+        def find(u):
+            while parent[u] != u:
+                parent[u] = parent[parent[u]]
+                u = parent[u]
+            return u
+
+        tree = defaultdict(set)
+        for w, u, v in edges:
+            ru = find(u)
+            rv = find(v)
+            if ru != rv:
+                parent[ru] = rv
+                tree[u].add(v)
+                tree[v].add(u)
+        return tree
+
+    def _update_flood_tree(self): #recomputes the broadcast tree a little after the topology events
+        while True:
+            hub.sleep(flood_tree_delay)
+            if self.flood_tree_dirty:
+                self.flood_tree_dirty = False
+                self.update_flood_tree()
+
+    def update_flood_tree(self): #sends the flood groups and rules of the switches whose port sets changed
+        tree = self.get_spanning_tree()
+        for dpid, dp in self.datapath_list.items():
+            # a port which carried a link is never an edge port, the link may come back
+            tree_ports = frozenset(self.adjacency[dpid][v] for v in tree[dpid])
+            edge_ports = frozenset(self.switch_ports.get(dpid, set()) - self.link_ports[dpid])
+            old = self.flood_ports.get(dpid)
+            if old == (tree_ports, edge_ports):
+                continue
+            self.install_flood_group(dp, tree_ports, edge_ports, old)
+            self.flood_ports[dpid] = (tree_ports, edge_ports)
+
+    def install_flood_group(self, datapath, tree_ports, edge_ports, old):
+        ofproto = datapath.ofproto
+        ofp_parser = datapath.ofproto_parser
+
+        # ALL group: a copy on every tree and edge port, never back on the input port
+        buckets = [ofp_parser.OFPBucket(actions=[ofp_parser.OFPActionOutput(port)])
+                   for port in sorted(tree_ports | edge_ports)]
+        if datapath.id not in self.flood_groups:
+            # the group may survive a reconnection of the switch
+            datapath.send_msg(ofp_parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE, ofproto.OFPGT_ALL, FLOOD_GROUP_ID))
+            datapath.send_msg(ofp_parser.OFPGroupMod(datapath, ofproto.OFPGC_ADD, ofproto.OFPGT_ALL, FLOOD_GROUP_ID, buckets))
+            self.flood_groups.add(datapath.id)
+        else:
+            datapath.send_msg(ofp_parser.OFPGroupMod(datapath, ofproto.OFPGC_MODIFY, ofproto.OFPGT_ALL, FLOOD_GROUP_ID, buckets))
+
+        # broadcasts coming from the tree are flooded by the switch itself, the ones
+        # coming from the hosts still go to the controller first (learning, proxy ARP)
+        old_tree_ports = old[0] if old is not None else frozenset()
+        actions = [ofp_parser.OFPActionGroup(FLOOD_GROUP_ID)]
+        self.en_clear_flow_entry = False
+        for port in tree_ports - old_tree_ports:
+            match = ofp_parser.OFPMatch(in_port=port, eth_dst='ff:ff:ff:ff:ff:ff')
+            self.add_flow(datapath, FLOOD_PRIORITY, match, actions)
+        for port in old_tree_ports - tree_ports:
+            match = ofp_parser.OFPMatch(in_port=port, eth_dst='ff:ff:ff:ff:ff:ff')
+            mod = ofp_parser.OFPFlowMod(datapath=datapath, command=ofproto.OFPFC_DELETE_STRICT,
+                                        priority=FLOOD_PRIORITY, match=match,
+                                        out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY)
+            datapath.send_msg(mod)
+
     @set_ev_cls(event.EventSwitchEnter) #Behaviour of the network when a switch enters it 
     def switch_enter_handler(self, ev):
         switch = ev.switch.dp
-        print("The switch", switch.id, "entered the network.")
+        self.logger.debug("The switch %s entered the network.", switch.id)
         self.switches_count += 1
+        self.switch_entered_at[switch.id] = time.time()
 
         if switch.id not in self.switches:
             self.switches.append(switch.id)
             self.datapath_list[switch.id] = switch
+            self.topology_changed()
+
+        # the ports which are not links are the edge ports of the broadcast tree
+        self.switch_ports[switch.id] = set(port.port_no for port in ev.switch.ports
+                                           if port.port_no <= switch.ofproto.OFPP_MAX)
+        self.flood_tree_dirty = True
 
         self.pkt_count = 0
 
     @set_ev_cls(event.EventSwitchLeave, MAIN_DISPATCHER) #Behaviour of the network when a switch leaves it 
     def switch_leave_handler(self, ev):
-        print (ev)
+        self.logger.debug("%s", ev)
         switch = ev.switch.dp.id
         if switch in self.switches:
             self.switches.remove(switch)
             self.switches_count -= 1
             del self.datapath_list[switch]
             del self.adjacency[switch]
+            # its rules stay in the registry, they are reconciled with its tables when it comes back
+            self.switch_ports.pop(switch, None)
+            self.topology_changed()
+
+    @set_ev_cls(event.EventPortAdd) #a new edge port has to be part of the broadcast tree
+    def port_add_handler(self, ev):
+        self.switch_ports.setdefault(ev.port.dpid, set()).add(ev.port.port_no)
+        self.flood_tree_dirty = True
+
+    @set_ev_cls(event.EventPortDelete)
+    def port_delete_handler(self, ev):
+        self.switch_ports.get(ev.port.dpid, set()).discard(ev.port.port_no)
+        self.link_ports[ev.port.dpid].discard(ev.port.port_no)
+        self.flood_tree_dirty = True
 
     @set_ev_cls(event.EventLinkAdd, MAIN_DISPATCHER) #Behaviour of the network when a link is added
     def link_add_handler(self, ev):
         s1 = ev.link.src
         s2 = ev.link.dst
+        self.restored_links.discard((s1.dpid, s2.dpid))
+        added = False
         if s1 not in self.links:
             self.links.append(s1)
             self.adjacency[s1.dpid][s2.dpid] = s1.port_no
+            added = True
         if s2 not in self.links:
             self.links.append(s2)
             self.adjacency[s2.dpid][s1.dpid] = s2.port_no
+            added = True
+        if added:
+            self.structure_version += 1
+            self.get_link_id(s1.dpid, s2.dpid)
+            self.link_ports[s1.dpid].add(s1.port_no)
+            self.link_ports[s2.dpid].add(s2.port_no)
+            self.flood_tree_dirty = True
+            changed = self.link_changed(s1.dpid, s2.dpid)
+            if changed:
+                self.logger.debug("The link from s%s to s%s changed the route of %d switch pairs.", s1.dpid, s2.dpid, len(changed))
 
     @set_ev_cls(event.EventLinkDelete, MAIN_DISPATCHER) #Behaviour of the network when a link is removed 
     def link_delete_handler(self, ev):
-        s1 = ev.link.src
-        s2 = ev.link.dst
+        self.remove_link(ev.link.src, ev.link.dst)
+
+    def remove_link(self, s1, s2): #s1 and s2 are the ports of both ends of the link
         #Exception handling if the switch is already deleted
         try:
             del self.adjacency[s1.dpid][s2.dpid]
@@ -424,9 +2038,17 @@ class ProjectController(app_manager.RyuApp):
             self.links.remove(s2)
         except KeyError:
             pass
-        print("The link from s",s1.dpid,"to s",s2.dpid,"has failed.")
-        #once the link is down the neighbours got the miss flow entries
-        self.send_miss_flow_entry_again(s1.dpid, s2.dpid)
+        self.structure_version += 1
+        changed = self.link_changed(s1.dpid, s2.dpid)
+        self.logger.debug("The link from s%s to s%s has failed.", s1.dpid, s2.dpid)
+        if changed:
+            self.logger.debug("The route of %d switch pairs changed.", len(changed))
+        # the host paths whose route changed were moved by link_changed, the ones still
+        # crossing the link are removed and recomputed, the other flows keep their rules
+        rerouted = self.invalidate_link(s1.dpid, s2.dpid)
+        if rerouted:
+            self.logger.debug("%d host paths crossed the link and were rerouted.", rerouted)
+        self.flood_tree_dirty = True
         
     #this allows to save all datapath in the OpenFlow tables of the hosts taken in exam
     @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -439,32 +2061,26 @@ class ProjectController(app_manager.RyuApp):
         elif ev.state == DEAD_DISPATCHER:
             if datapath.id in self.datapaths:
                 self.logger.debug('unregister datapath: %016x', datapath.id)
-                del self.datapaths[datapath.id]  
+                del self.datapaths[datapath.id]
+                # the barriers sent to this switch will never be answered, their setups can not complete
+                setups = set()
+                for key in [key for key in self.pending_barriers if key[0] == datapath.id]:
+                    setups.add(self.pending_barriers.pop(key))
+                for setup in setups:
+                    self.abort_setup(setup)
                 
-    #this allow to send to send the messages containing the missing flow entry 
-    def send_miss_flow_entry_again(self, s1, s2): 
-            for datapath in self.datapaths.values():
-                if (datapath.id == s1 or datapath.id == s2):
-                    self.remove_flows(datapath, 0)
-            for datapath in self.datapaths.values():
-                if (datapath.id == s1 or datapath.id == s2):
-                    self.en_clear_flow_entry =  False
-                    self.add_flow(datapath, 0, self.match_miss_flow_entry, self.actions_miss_flow_entry)
-                 
-    #through this the old flows are removed                
-    def remove_flows(self, datapath, table_id):
+    #through this the flows of one path are removed, whatever their match
+    def delete_path_flows(self, datapath, cookie):
         ofp_parser = datapath.ofproto_parser
-        ofproto = datapath.ofproto
         empty_match = ofp_parser.OFPMatch()
         instructions = []
-        flow_mod = self.remove_table_flows(datapath, table_id, empty_match, instructions)
-        print ("All flow entries contained in table ", table_id,"are removed")
+        flow_mod = self.remove_table_flows(datapath, 0, empty_match, instructions, cookie, COOKIE_MASK)
         datapath.send_msg(flow_mod)
     
     #this function creates OFP flow mod messages in order to remove flows from the table
-    def remove_table_flows(self, datapath, table_id, match, instructions):
+    def remove_table_flows(self, datapath, table_id, match, instructions, cookie=0, cookie_mask=0):
         ofproto = datapath.ofproto
-        flow_mod = datapath.ofproto_parser.OFPFlowMod(datapath, 0, 0, table_id,
+        flow_mod = datapath.ofproto_parser.OFPFlowMod(datapath, cookie, cookie_mask, table_id,
                                                       ofproto.OFPFC_DELETE, 0, 0,
                                                       1,
                                                       ofproto.OFPCML_NO_BUFFER,
@@ -472,3 +2088,54 @@ class ProjectController(app_manager.RyuApp):
                                                       OFPG_ANY, 0,
                                                       match, instructions)
         return flow_mod
+
+
+class MetricsController(ControllerBase): #GET /metrics, latency histograms and counters in the Prometheus text format
+
+    def __init__(self, req, link, data, **config):
+        super(MetricsController, self).__init__(req, link, data, **config)
+        self.app = data[METRICS_INSTANCE]
+
+    @route('metrics', '/metrics', methods=['GET'])
+    def get_metrics(self, req, **kwargs):
+        app = self.app
+        counters = {
+            'flowmods_sent': app.flowmods_sent,
+            'flowmods_avoided': app.flowmods_avoided,
+            'packet_ins_avoided': app.packet_ins_avoided,
+            'setups_coalesced': app.setups_coalesced,
+            'arp_proxied': app.arp_proxied,
+        }
+        body = prometheus_text(app.timers, counters)
+        return Response(content_type='text/plain', charset='utf-8', body=body.encode('utf-8'),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+class Reconciliation(object): #flow and group stats of a reconnected switch, collected until both tables are complete
+
+    def __init__(self, datapath):
+        self.datapath = datapath
+        self.flows = [] #OFPFlowStats of table 0
+        self.groups = [] #OFPGroupDescStats
+        self.waiting = set(['flows', 'groups'])
+        self.started = time.time()
+
+
+class PathSetup(object): #path installation waiting for the barrier replies of its switches
+
+    def __init__(self, src, dst, ip_src, ip_dst, msg):
+        self.src = src
+        self.dst = dst
+        self.ip_src = ip_src
+        self.ip_dst = ip_dst
+        self.msg = msg #packet-in released once the whole path is confirmed
+        self.ingress = None #output ports of the src switch, programmed last
+        self.cookie = 0 #cookie of the flow entries of the path
+        self.backup = None #backup port of the src switch with fast failover
+        self.switches = set() #switches programmed so far
+        self.waiting = set() #(dpid, xid) of the barriers not answered yet
+        self.confirmed = False #True once the downstream switches answered
+        self.hops = 0 #downstream switches crossed by the released packet
+        self.queued = [] #packet-ins of the same flow received while the setup was in flight
+        self.changed_at = None #topology_changed_at of the controller when the setup started
+        self.started = time.time()
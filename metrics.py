@@ -0,0 +1,76 @@
+from array import array
+
+import math
+
+QUANTILES = (0.5, 0.99, 0.999) #quantiles exported for every histogram
+
+
+class LatencyHistogram(object): #HDR-style histogram of durations in ns, with a constant relative precision
+
+    def __init__(self, significant_bits=7):
+        self.bits = significant_bits
+        self.half = 1 << (significant_bits - 1)
+        # the values below 2**bits have their own bucket, above it every power of
+        # two is split in half sub-buckets (1.6% precision with 7 bits)
+        self.counts = array('Q', bytes(8 * ((1 << significant_bits) + 64 * self.half)))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value): #O(1), no allocation
+        if value < 0:
+            value = 0
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def index(self, value):
+        shift = value.bit_length() - self.bits
+        if shift <= 0:
+            return value
+        return (1 << self.bits) + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def highest_equivalent(self, index): #largest value counted in the bucket
+        if index < 1 << self.bits:
+            return index
+        k = index - (1 << self.bits)
+        shift = k // self.half + 1
+        mantissa = k % self.half + self.half
+        return ((mantissa + 1) << shift) - 1
+
+    def percentile(self, q): #value below which a fraction q of the recorded values are
+        if not self.count:
+            return 0
+        rank = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= rank:
+                    return min(self.highest_equivalent(i), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = array('Q', bytes(8 * len(self.counts)))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+
+def prometheus_text(histograms, counters, prefix='ryu_routing'): #text exposition format of the histograms and counters
+    lines = []
+    for name in sorted(histograms):
+        h = histograms[name]
+        metric = '%s_%s_seconds' % (prefix, name)
+        lines.append('# TYPE %s summary' % metric)
+        for q in QUANTILES:
+            lines.append('%s{quantile="%s"} %.9f' % (metric, q, h.percentile(q) / 1e9))
+        lines.append('%s_sum %.9f' % (metric, h.total / 1e9))
+        lines.append('%s_count %d' % (metric, h.count))
+    for name in sorted(counters):
+        metric = '%s_%s_total' % (prefix, name)
+        lines.append('# TYPE %s counter' % metric)
+        lines.append('%s %d' % (metric, counters[name]))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,306 @@
+#Routing strategies of the dijkstra.py controller, selected with the routing_strategy
+#option of the Ryu configuration file:
+#
+#   [DEFAULT]
+#   routing_strategy = ant_colony
+#
+#A strategy answers get_path(src, dst) with the list of the switches from src to dst.
+#New algorithms are added by subclassing RoutingStrategy and registering the class:
+#
+#   @register_strategy('my_algorithm')
+#   class MyRouting(RoutingStrategy):
+#       def get_path(self, src, dst):
+#           ...
+
+from ryu.lib import hub
+
+import abc, time
+
+try:
+    import numpy as np
+except ImportError: #only the ant colony needs NumPy
+    np = None
+
+ant_count = 16 #ants sent towards a destination at every iteration
+ant_iterations = 4 #iterations of every colony in a round
+ant_interval = 1 #seconds between two rounds of the colonies
+ant_alpha = 1.0 #weight of the pheromone in the choice of the next hop
+ant_beta = 1.0 #weight of the link delay in the choice of the next hop
+ant_decay = 0.95 #fraction of the pheromone left after an iteration
+ant_best = 2 #ants depositing pheromone at every iteration
+ant_min_pheromone = 0.01 #lower bound of the pheromone, so that no link is abandoned for good
+
+STRATEGIES = {} #name -> class of the routing strategies
+
+
+def register_strategy(name): #class decorator adding a strategy to STRATEGIES
+    def register(cls):
+        cls.name = name
+        STRATEGIES[name] = cls
+        return cls
+    return register
+
+
+def get_strategy(name):
+    if name not in STRATEGIES:
+        raise ValueError('unknown routing strategy %s (%s)' % (name, ', '.join(sorted(STRATEGIES))))
+    return STRATEGIES[name]
+
+
+class RoutingStrategy(abc.ABC): #path computation of the controller, which keeps the topology
+
+    name = None
+
+    def __init__(self, app):
+        self.app = app
+
+    @abc.abstractmethod
+    def get_path(self, src, dst): #switches from src to dst, both included
+        pass
+
+    def path_ready(self, src, dst): #False if get_path would have to run a long computation, which the controller leaves to its workers
+        return True
+
+    def topology_changed(self): #switches entered or left the network
+        pass
+
+    def link_changed(self, u, v): #the link u-v was added, removed or changed cost, returns the switch pairs whose route changed
+        return set()
+
+
+@register_strategy('dijkstra')
+class DijkstraRouting(RoutingStrategy): #delay-based shortest paths, the trees are kept and repaired by the controller
+
+    def get_path(self, src, dst):
+        return self.app.shortest_path(src, dst)
+
+    def path_ready(self, src, dst):
+        return self.app.shortest_path_ready(src, dst)
+
+
+@register_strategy('ant_colony')
+class AntColonyRouting(RoutingStrategy): #ant colony optimization running in background, get_path reads the best routes found
+
+    def __init__(self, app):
+        if np is None:
+            raise ImportError('NumPy is needed by the ant_colony routing strategy')
+        super(AntColonyRouting, self).__init__(app)
+        self.rng = np.random.default_rng()
+        # switches and links as padded arrays: row i holds the neighbours of nodes[i] and the delay towards them
+        self.nodes = []
+        self.index = {}
+        self.neighbours = None #node index of the neighbours, -1 in the padding
+        self.weights = None #link delays, inf in the padding
+        self.colonies = {} #destination dpid -> Colony
+        self.epoch = 0
+        self.thread = hub.spawn(self._run_colonies)
+
+    def get_path(self, src, dst):
+        if src == dst:
+            return [src]
+        if self.neighbours is None:
+            self.build_graph()
+        if src not in self.index or dst not in self.index:
+            return [dst]
+        colony = self.colonies.get(dst)
+        if colony is None:
+            colony = self.colonies[dst] = Colony(self.index[dst], self.neighbours)
+        colony.sources.add(self.index[src])
+
+        path = self.walk(colony, self.index[src])
+        if path is None:
+            # no ant reached dst from src yet, the shortest path is the first known route
+            path = self.app.shortest_path(src, dst)
+            if path[0] == src:
+                self.add_route(colony, [self.index[node] for node in path])
+        return path
+
+    def path_ready(self, src, dst): #a route found by the ants, or the shortest path the first request falls back to
+        colony = self.colonies.get(dst)
+        if colony is not None and self.neighbours is not None and src in self.index and \
+                colony.next_slot[self.index[src]] >= 0:
+            return True
+        return self.app.shortest_path_ready(src, dst)
+
+    def walk(self, colony, i): #O(path length) walk over the best next hops, None if no route is known
+        path = [self.nodes[i]]
+        while i != colony.dst:
+            slot = colony.next_slot[i]
+            if slot < 0 or len(path) > len(self.nodes):
+                return None
+            i = self.neighbours[i, slot]
+            path.append(self.nodes[i])
+        return path
+
+    def topology_changed(self): #the arrays are built again on the next request, and the colonies start over
+        self.epoch += 1
+        self.neighbours = None
+        self.weights = None
+        self.colonies = {}
+
+    def link_changed(self, u, v):
+        if self.neighbours is None:
+            return set()
+        if u not in self.index or v not in self.index:
+            self.topology_changed()
+            return set()
+        for node in (u, v):
+            self.update_row(self.index[node])
+
+        # the best routes are kept, their delays are computed again with the new link costs
+        changed = set()
+        for dst, colony in self.colonies.items():
+            for i in self.evaluate_routes(colony):
+                changed.add((self.nodes[i], dst))
+        return changed
+
+    def build_graph(self):
+        self.nodes = sorted(self.app.switches)
+        self.index = dict((dpid, i) for i, dpid in enumerate(self.nodes))
+        rows = [[(self.index[p], w) for p, w in self.app.get_neighbours(u) if p in self.index] for u in self.nodes]
+        degree = max([len(row) for row in rows] or [0])
+        self.neighbours = np.full((len(self.nodes), max(degree, 1)), -1, dtype=np.int64)
+        self.weights = np.full(self.neighbours.shape, np.inf)
+        for i, row in enumerate(rows):
+            for slot, (j, w) in enumerate(row):
+                self.neighbours[i, slot] = j
+                self.weights[i, slot] = w
+
+    def update_row(self, i): #links and delays of nodes[i], the pheromone of the links still there is kept
+        row = dict((self.index[p], w) for p, w in self.app.get_neighbours(self.nodes[i]) if p in self.index)
+        if len(row) > self.neighbours.shape[1]:
+            extra = len(row) - self.neighbours.shape[1]
+            self.neighbours = np.pad(self.neighbours, ((0, 0), (0, extra)), constant_values=-1)
+            self.weights = np.pad(self.weights, ((0, 0), (0, extra)), constant_values=np.inf)
+            for colony in self.colonies.values():
+                colony.pheromone = np.pad(colony.pheromone, ((0, 0), (0, extra)))
+
+        old = [int(j) for j in self.neighbours[i] if j >= 0]
+        slots = [j for j in old if j in row] + [j for j in row if j not in old]
+        for colony in self.colonies.values():
+            pheromone = dict(zip(old, colony.pheromone[i]))
+            colony.pheromone[i] = 0
+            for slot, j in enumerate(slots):
+                colony.pheromone[i, slot] = pheromone.get(j, 1.0)
+            hop = colony.next_slot[i]
+            colony.next_slot[i] = slots.index(old[hop]) if hop >= 0 and old[hop] in row else -1
+        self.neighbours[i] = -1
+        self.weights[i] = np.inf
+        for slot, j in enumerate(slots):
+            self.neighbours[i, slot] = j
+            self.weights[i, slot] = row[j]
+
+    def evaluate_routes(self, colony): #delay of the best routes with the current link costs, returns the nodes whose route changed
+        n = len(self.nodes)
+        has_route = colony.next_slot >= 0
+        nodes = np.nonzero(has_route)[0]
+        slots = colony.next_slot[has_route]
+        hops = self.neighbours[nodes, slots]
+        delays = self.weights[nodes, slots]
+
+        # the next hops form a forest rooted in dst, the costs settle in (depth) vectorized steps
+        cost = np.full(n, np.inf)
+        cost[colony.dst] = 0
+        for _ in range(n):
+            new = cost.copy()
+            new[nodes] = delays + cost[hops]
+            new[colony.dst] = 0
+            if np.array_equal(new, cost):
+                break
+            cost = new
+
+        lost = has_route & np.isinf(cost)
+        colony.next_slot[lost] = -1
+        changed = np.nonzero(lost | ((cost != colony.cost) & ~np.isinf(cost)))[0]
+        colony.cost = cost
+        return changed
+
+    def add_route(self, colony, path): #the route improves the next hop of the nodes it reaches dst faster from, returns them
+        changed = []
+        suffix = 0.0
+        for k in range(len(path) - 2, -1, -1):
+            i = path[k]
+            slot = int(np.nonzero(self.neighbours[i] == path[k + 1])[0][0])
+            suffix += self.weights[i, slot]
+            # the cost strictly decreases along the next hops, so the routes can not loop
+            if suffix < colony.cost[i] - 1e-9:
+                colony.cost[i] = suffix
+                colony.next_slot[i] = slot
+                changed.append(i)
+        return changed
+
+    def run_ants(self, colony): #one iteration of the colony, returns the nodes whose best route changed
+        n, degree = self.neighbours.shape
+        sources = np.fromiter(colony.sources, dtype=np.int64)
+        position = self.rng.choice(sources, ant_count)
+        visited = np.zeros((ant_count, n), dtype=bool)
+        visited[np.arange(ant_count), position] = True
+        length = np.zeros(ant_count)
+        hops = np.zeros(ant_count, dtype=np.int64)
+        trail_nodes = np.zeros((ant_count, n), dtype=np.int64)
+        trail_slots = np.zeros((ant_count, n), dtype=np.int64)
+        heuristic = (1.0 / self.weights) ** ant_beta
+
+        # all the ants move at once, each one to a neighbour it has not visited yet
+        walking = np.nonzero(position != colony.dst)[0]
+        while walking.size:
+            nodes = position[walking]
+            candidates = self.neighbours[nodes]
+            allowed = (candidates >= 0) & ~visited[walking[:, None], np.maximum(candidates, 0)]
+            attraction = np.where(allowed, colony.pheromone[nodes] ** ant_alpha * heuristic[nodes], 0.0)
+            cumulative = attraction.cumsum(axis=1)
+            moving = cumulative[:, -1] > 0 #the other ants are stuck in a dead end
+            walking, nodes, candidates, cumulative = walking[moving], nodes[moving], candidates[moving], cumulative[moving]
+
+            draw = self.rng.random(walking.size) * cumulative[:, -1]
+            slots = (cumulative <= draw[:, None]).sum(axis=1)
+            trail_nodes[walking, hops[walking]] = nodes
+            trail_slots[walking, hops[walking]] = slots
+            hops[walking] += 1
+            length[walking] += self.weights[nodes, slots]
+            position[walking] = candidates[np.arange(walking.size), slots]
+            visited[walking, position[walking]] = True
+            walking = walking[position[walking] != colony.dst]
+
+        # evaporation, then the best ants of the iteration lay pheromone on their links
+        colony.pheromone *= ant_decay
+        np.maximum(colony.pheromone, ant_min_pheromone, out=colony.pheromone, where=self.neighbours >= 0)
+        arrived = np.nonzero(position == colony.dst)[0]
+        changed = set()
+        for ant in arrived[np.argsort(length[arrived])[:ant_best]]:
+            colony.pheromone[trail_nodes[ant, :hops[ant]], trail_slots[ant, :hops[ant]]] += 1.0 / length[ant]
+        for ant in arrived:
+            path = [int(i) for i in trail_nodes[ant, :hops[ant]]] + [colony.dst]
+            changed.update(self.add_route(colony, path))
+        return changed
+
+    def _run_colonies(self): #ant iterations of the requested destinations, between the other handlers
+        while True:
+            hub.sleep(ant_interval)
+            epoch = self.epoch
+            changed = set()
+            start = time.time()
+            for dst, colony in list(self.colonies.items()):
+                for _ in range(ant_iterations):
+                    if self.epoch != epoch or self.colonies.get(dst) is not colony:
+                        break #the topology changed, the colony starts over
+                    for i in self.run_ants(colony):
+                        changed.add((self.nodes[i], dst))
+                    hub.sleep(0)
+            if changed and self.epoch == epoch:
+                self.app.logger.debug("The ants improved the route of %d switch pairs in %.1f ms.",
+                                      len(changed), (time.time() - start) * 1000)
+                # the installed paths of these pairs move to the better routes too
+                self.app.routes_changed(changed)
+
+
+class Colony(object): #pheromone and best known routes towards one destination switch
+
+    def __init__(self, dst, neighbours):
+        n = len(neighbours)
+        self.dst = dst
+        self.sources = set() #node indexes the ants start from, the sources of the requested paths
+        self.pheromone = np.where(neighbours >= 0, 1.0, 0.0)
+        self.next_slot = np.full(n, -1, dtype=np.int64) #column of the best next hop in the neighbour arrays
+        self.cost = np.full(n, np.inf) #delay of the best route towards dst
+        self.cost[dst] = 0
@@ -0,0 +1,119 @@
+#Binary snapshots of the state of the dijkstra.py controller, reloaded after a restart
+#so that the network does not have to be learned and programmed again.
+#
+#The file is a header followed by tables of fixed-size big-endian records, read in
+#place from a read-only mmap of the file:
+#   header   magic, save time, next cookie, number of records of every table
+#   hosts    MAC, dpid, port
+#   arp      IP, MAC, time the entry was last seen
+#   links    dpid, neighbour dpid, port of dpid towards the neighbour
+#   paths    source IP, destination IP, cookie of the host path
+#   flows    dpid, source IP, destination IP, cookie, group type (-1 for an output rule),
+#            group src and dst switches, output port, first bucket and bucket count
+#   buckets  port, weight
+#   groups   dpid, group type, src, dst, group id
+#   dests    prefix flag, IP (or network), mask, cookie of the destination rules
+#The file is written next to its final path and renamed, so a crash never leaves half of it.
+
+import mmap, os, socket, struct, time
+
+MAGIC = b'RYUSNAP2'
+HEADER = struct.Struct('!8sdQ8I')
+HOST = struct.Struct('!6sQI')
+ARP = struct.Struct('!4s6sd')
+LINK = struct.Struct('!QQI')
+PATH = struct.Struct('!4s4sQ')
+FLOW = struct.Struct('!Q4s4sQbQQIIH')
+BUCKET = struct.Struct('!IH')
+GROUP = struct.Struct('!QBQQI')
+DESTINATION = struct.Struct('!?4s4sQ')
+TABLES = ('hosts', 'arp', 'links', 'paths', 'flows', 'buckets', 'groups', 'destinations')
+RECORDS = (HOST, ARP, LINK, PATH, FLOW, BUCKET, GROUP, DESTINATION)
+
+
+def mac_bytes(mac):
+    return bytes.fromhex(mac.replace(':', ''))
+
+
+def mac_str(data):
+    return ':'.join('%02x' % b for b in data)
+
+
+def save(path, hosts, arp, links, paths, flows, groups, destinations, next_cookie): #writes the snapshot, the rules are the tuples of the flow registry
+    buckets = []
+    tables = dict((name, []) for name in TABLES)
+    for mac, (dpid, port) in hosts.items():
+        tables['hosts'].append(HOST.pack(mac_bytes(mac), dpid, port))
+    for ip, (mac, seen) in arp.items():
+        tables['arp'].append(ARP.pack(socket.inet_aton(ip), mac_bytes(mac), seen))
+    for u, v, port in links:
+        tables['links'].append(LINK.pack(u, v, port))
+    for (ip_src, ip_dst), cookie in paths.items():
+        tables['paths'].append(PATH.pack(socket.inet_aton(ip_src), socket.inet_aton(ip_dst), cookie))
+    for (dpid, ip_src, ip_dst), (rule, cookie) in flows.items():
+        if len(rule) == 1:
+            record = (-1, 0, 0, rule[0], 0, 0)
+        else:
+            record = (rule[0], rule[1], rule[2], 0, len(buckets), len(rule[3]))
+            buckets.extend(rule[3])
+        tables['flows'].append(FLOW.pack(dpid, socket.inet_aton(ip_src), socket.inet_aton(ip_dst), cookie, *record))
+    tables['buckets'] = [BUCKET.pack(port, weight) for port, weight in buckets]
+    for (dpid, gtype, src, dst), group_id in groups.items():
+        tables['groups'].append(GROUP.pack(dpid, gtype, src, dst, group_id))
+    for key, cookie in destinations.items():
+        # a destination is a host IP, or a (network, mask) prefix
+        if isinstance(key, tuple):
+            record = (True, socket.inet_aton(key[0]), socket.inet_aton(key[1]))
+        else:
+            record = (False, socket.inet_aton(key), bytes(4))
+        tables['destinations'].append(DESTINATION.pack(*(record + (cookie,))))
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, time.time(), next_cookie, *[len(tables[name]) for name in TABLES]))
+        for name in TABLES:
+            f.write(b''.join(tables[name]))
+    os.replace(tmp, path)
+
+
+def load(path): #dict of the tables as lists of tuples (see save), None if there is no valid snapshot
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+    with f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, memoryview(data) as view:
+            header = HEADER.unpack_from(view, 0)
+            if header[0] != MAGIC:
+                return None
+            counts = header[3:]
+            if len(view) != HEADER.size + sum(record.size * count for record, count in zip(RECORDS, counts)):
+                return None #truncated or from another version
+
+            tables = {'saved': header[1], 'next_cookie': header[2]}
+            offset = HEADER.size
+            for name, record, count in zip(TABLES, RECORDS, counts):
+                end = offset + record.size * count
+                tables[name] = list(record.iter_unpack(view[offset:end]))
+                offset = end
+
+    ip = socket.inet_ntoa
+    hosts = dict((mac_str(mac), (dpid, port)) for mac, dpid, port in tables['hosts'])
+    arp = dict((ip(addr), (mac_str(mac), seen)) for addr, mac, seen in tables['arp'])
+    paths = dict(((ip(src), ip(dst)), cookie) for src, dst, cookie in tables['paths'])
+    buckets = tables['buckets']
+    flows = {}
+    for dpid, src, dst, cookie, gtype, group_src, group_dst, port, first, count in tables['flows']:
+        if gtype < 0:
+            rule = (port,)
+        else:
+            rule = (gtype, group_src, group_dst, tuple(buckets[first:first + count]))
+        flows[dpid, ip(src), ip(dst)] = (rule, cookie)
+    groups = dict(((dpid, gtype, src, dst), group_id) for dpid, gtype, src, dst, group_id in tables['groups'])
+    destinations = dict(((ip(addr), ip(mask)) if prefix else ip(addr), cookie)
+                        for prefix, addr, mask, cookie in tables['destinations'])
+    return {'saved': tables['saved'], 'hosts': hosts, 'arp': arp, 'links': tables['links'],
+            'paths': paths, 'flows': flows, 'groups': groups, 'destinations': destinations,
+            'next_cookie': tables['next_cookie']}
@@ -0,0 +1,56 @@
+#Controllers and topologies shared by the tests, the port of a switch towards a
+#neighbour is the dpid of the neighbour.
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from collections import Counter
+
+from ryu.controller import ofp_event
+
+import benchmark
+import dijkstra
+
+
+def make_controller(links): #controller without datapaths, the link costs come from its link table
+    dijkstra.path_workers = 0
+    ctl = dijkstra.ProjectController()
+    for dpid in set(node for link in links for node in link):
+        ctl.datapath_list[dpid] = object()
+        ctl.switches.append(dpid)
+    for (u, v), w in links.items():
+        add_link(ctl, u, v, w)
+    return ctl
+
+
+def add_link(ctl, u, v, w):
+    ctl.adjacency[u][v] = v
+    ctl.adjacency[v][u] = u
+    ctl.link_table[min(u, v), max(u, v)] = (w, 10)
+
+
+def remove_link(ctl, u, v):
+    ctl.adjacency[u][v] = None
+    ctl.adjacency[v][u] = None
+
+
+def packet_in(ctl, dp, in_port, data): #packet-in of a raw frame received on in_port of dp
+    parser = dp.ofproto_parser
+    msg = parser.OFPPacketIn(dp, buffer_id=dp.ofproto.OFP_NO_BUFFER, total_len=len(data), reason=0,
+                             table_id=0, cookie=0, match=parser.OFPMatch(in_port=in_port), data=data)
+    ctl._packet_in_handler(ofp_event.EventOFPPacketIn(msg))
+
+
+class RecordingDatapath(benchmark.FakeDatapath): #fake datapath keeping the messages sent to it
+
+    def __init__(self, dpid):
+        super(RecordingDatapath, self).__init__(dpid, Counter(), [])
+        self.sent = []
+
+    def send_msg(self, msg):
+        super(RecordingDatapath, self).send_msg(msg)
+        self.sent.append(msg)
+
+    def messages(self, name): #messages of one type, in the order they were sent
+        return [msg for msg in self.sent if msg.__class__.__name__ == name]
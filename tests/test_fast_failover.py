@@ -0,0 +1,24 @@
+#The backup next hops of fast failover must never send the packets back
+#upstream of the failed link (run with python -m pytest tests).
+
+from helpers import make_controller
+
+
+def test_detour_along_the_tree_of_dst():
+    ctl = make_controller({(1, 2): 1, (2, 3): 1, (1, 4): 1, (4, 5): 1, (5, 3): 1})
+    path = ctl.get_path(1, 3)
+    assert path == [1, 2, 3]
+    backups, detours = ctl.get_backup_ports(path, 3)
+    # s1 falls back to s4, whose detour joins the path in s3; s2 has no loop-free alternate
+    assert backups == {1: 4}
+    assert detours == [(4, [(5, 2)]), (5, [(3, 1)])]
+
+
+def test_detour_joining_upstream_is_not_used():
+    # the primary path is not the shortest one, as the ant colony may return
+    ctl = make_controller({(1, 2): 1, (2, 3): 1, (3, 4): 10, (1, 4): 1, (3, 5): 1, (5, 1): 1})
+    backups, detours = ctl.get_backup_ports([1, 2, 3, 4], 4)
+    # s2 and s3 could only fall back to s1, s2 or s5 (whose tree route goes through s1),
+    # whose primary rules send the packets back to the failed link
+    assert backups == {1: 4}
+    assert detours == []
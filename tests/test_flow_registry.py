@@ -0,0 +1,69 @@
+#The registry of the installed path rules must follow the entries the
+#switches really have (run with python -m pytest tests).
+
+from ryu.controller import ofp_event
+
+from helpers import make_controller, remove_link, RecordingDatapath
+
+
+def flow_removed(ctl, dp, cookie, eth_type): #idle expiry of one entry of a path
+    ofp = dp.ofproto
+    ofp_parser = dp.ofproto_parser
+    msg = ofp_parser.OFPFlowRemoved(dp, cookie=cookie, reason=ofp.OFPRR_IDLE_TIMEOUT,
+                                    match=ofp_parser.OFPMatch(eth_type=eth_type))
+    ctl._flow_removed_handler(ofp_event.EventOFPFlowRemoved(msg))
+
+
+def test_group_kept_until_both_entries_expire():
+    ctl = make_controller({(1, 2): 1, (1, 3): 1})
+    dp = ctl.datapath_list[1] = RecordingDatapath(1)
+    out_ports = [(2, 1.0), (3, 1.0)]
+    cookie = ctl.index_path('10.0.0.1', '10.0.0.2', [(1, out_ports)], {})
+    assert ctl.install_switch_rules(1, out_ports, 1, 2, '10.0.0.1', '10.0.0.2', cookie=cookie)
+    key = (1, '10.0.0.1', '10.0.0.2')
+    group_id = dp.messages('OFPGroupMod')[0].group_id
+
+    # the ARP entry expires during a long flow, the IPv4 entry still uses the group
+    flow_removed(ctl, dp, cookie, 0x0806)
+    assert key in ctl.flow_registry
+    assert key in ctl.stale_flows
+    assert len(dp.messages('OFPGroupMod')) == 1
+
+    # the next installation sends the entries again with the same group
+    assert ctl.install_switch_rules(1, out_ports, 1, 2, '10.0.0.1', '10.0.0.2', cookie=cookie)
+    assert len(dp.messages('OFPFlowMod')) == 4
+    assert len(dp.messages('OFPGroupMod')) == 1
+    assert key not in ctl.expired_flows
+
+    # once both entries are gone, the pair is forgotten and its group deleted
+    flow_removed(ctl, dp, cookie, 0x0806)
+    flow_removed(ctl, dp, cookie, 0x0800)
+    assert key not in ctl.flow_registry
+    delete = dp.messages('OFPGroupMod')[-1]
+    assert (delete.command, delete.group_id) == (dp.ofproto.OFPGC_DELETE, group_id)
+
+
+def test_deletes_are_processed_before_the_new_route():
+    ctl = make_controller({(1, 2): 1, (1, 3): 1, (3, 2): 1})
+    for dpid in (1, 2, 3):
+        ctl.datapath_list[dpid] = RecordingDatapath(dpid)
+    ctl.hosts['00:00:00:00:00:01'] = (1, 10)
+    ctl.hosts['00:00:00:00:00:02'] = (2, 10)
+    ctl.learn_arp('10.0.0.1', '00:00:00:00:00:01')
+    ctl.learn_arp('10.0.0.2', '00:00:00:00:00:02')
+    switch_ports = [(1, [(2, 1.0)]), (2, [(10, 1.0)])]
+    cookie = ctl.index_path('10.0.0.1', '10.0.0.2', switch_ports, {})
+    for node, out_ports in switch_ports:
+        ctl.install_switch_rules(node, out_ports, 1, 2, '10.0.0.1', '10.0.0.2', cookie=cookie)
+
+    for dpid in (1, 2):
+        del ctl.datapath_list[dpid].sent[:]
+
+    # the barrier follows the delete, before any rule of the new route
+    remove_link(ctl, 1, 2)
+    assert ctl.invalidate_link(1, 2) == 1
+    for dpid in (1, 2):
+        dp = ctl.datapath_list[dpid]
+        delete, barrier = dp.sent[:2]
+        assert (delete.__class__.__name__, delete.command, delete.cookie) == ('OFPFlowMod', dp.ofproto.OFPFC_DELETE, cookie)
+        assert barrier.__class__.__name__ == 'OFPBarrierRequest'
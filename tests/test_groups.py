@@ -0,0 +1,45 @@
+#Group ids are allocated per switch, shared by the rules of the same switches
+#and released with the last rule using them (run with python -m pytest tests).
+
+from helpers import make_controller, RecordingDatapath
+
+
+def test_group_lifecycle():
+    ctl = make_controller({})
+    dp = ctl.datapath_list[1] = RecordingDatapath(1)
+    ofp = dp.ofproto
+    select = (ofp.OFPGT_SELECT, 1, 3, ((2, 10), (3, 5)))
+    other = (ofp.OFPGT_SELECT, 2, 3, ((2, 10), (3, 10)))
+    rebalanced = select[:3] + (((2, 10), (3, 10)),)
+    failover = (ofp.OFPGT_FF, 1, 4, ((2, 0), (4, 0)))
+
+    # the flows between the same switches share the group, new buckets modify it
+    assert ctl.acquire_group(dp, select) == 1
+    assert ctl.acquire_group(dp, select) == 1
+    assert ctl.acquire_group(dp, other) == 2
+    assert ctl.acquire_group(dp, rebalanced) == 1
+
+    # deleted with the last of its three rules, its id is reused first
+    ctl.release_group(1, select)
+    ctl.release_group(1, select)
+    assert ctl.groups[1, ofp.OFPGT_SELECT, 1, 3][1] == 1
+    ctl.release_group(1, rebalanced)
+    assert (1, ofp.OFPGT_SELECT, 1, 3) not in ctl.groups
+    assert ctl.group_free[1] == [1]
+    assert ctl.acquire_group(dp, failover) == 1
+    assert ctl.acquire_group(dp, select) == 3
+
+    # plain output rules have no group
+    ctl.release_group(1, (2,))
+
+    assert [(msg.command, msg.type, msg.group_id) for msg in dp.messages('OFPGroupMod')] == [
+        (ofp.OFPGC_ADD, ofp.OFPGT_SELECT, 1),
+        (ofp.OFPGC_ADD, ofp.OFPGT_SELECT, 2),
+        (ofp.OFPGC_MODIFY, ofp.OFPGT_SELECT, 1),
+        (ofp.OFPGC_DELETE, ofp.OFPGT_SELECT, 1),
+        (ofp.OFPGC_ADD, ofp.OFPGT_FF, 1),
+        (ofp.OFPGC_ADD, ofp.OFPGT_SELECT, 3),
+    ]
+
+    # every switch has its own ids
+    assert ctl.allocate_group_id(2) == 1
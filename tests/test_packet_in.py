@@ -0,0 +1,57 @@
+#Packet-ins of hosts the controller does not know yet (run with python -m pytest tests).
+
+import dijkstra
+
+from ryu.lib.packet import arp
+
+from benchmark import ip_frame
+from helpers import make_controller, packet_in, RecordingDatapath
+
+
+def flooded(dp): #True if the last message sent is a packet-out flooding the frame
+    out = dp.messages('OFPPacketOut')[-1]
+    return [action.port for action in out.actions] == [dp.ofproto.OFPP_FLOOD]
+
+
+def test_destination_arp_rule_matches_the_replies_only():
+    ctl = make_controller({})
+    dp = ctl.datapath_list[1] = RecordingDatapath(1)
+    ctl.install_destination_rule(1, '10.0.0.2', 3)
+    ip_rule, arp_rule = dp.messages('OFPFlowMod')
+    assert 'arp_op' not in ip_rule.match
+    assert arp_rule.match['arp_op'] == arp.ARP_REPLY
+
+
+def test_unknown_destination_is_flooded():
+    ctl = make_controller({})
+    dp = ctl.datapath_list[1] = RecordingDatapath(1)
+    packet_in(ctl, dp, 1, ip_frame('00:00:00:00:00:01', '10.0.0.1', '00:00:00:00:00:02', '10.0.0.2'))
+    assert flooded(dp)
+
+    # the reply of a host whose request was forwarded by the switches without reaching the controller
+    packet_in(ctl, dp, 1, dijkstra.build_arp(arp.ARP_REPLY, '00:00:00:00:00:01', '10.0.0.1',
+                                             '00:00:00:00:00:03', '10.0.0.3'))
+    assert flooded(dp)
+    assert ctl.arp_table['10.0.0.1'] == '00:00:00:00:00:01'
+
+
+def test_moved_host_is_answered():
+    ctl = make_controller({(1, 2): 1})
+    dp1 = ctl.datapath_list[1] = RecordingDatapath(1)
+    ctl.datapath_list[2] = RecordingDatapath(2)
+    ctl.link_ports[1].add(2)
+    ctl.link_ports[2].add(1)
+    ctl.hosts['00:00:00:00:00:01'] = (1, 3)
+    ctl.hosts['00:00:00:00:00:02'] = (2, 3)
+    ctl.learn_arp('10.0.0.2', '00:00:00:00:00:02')
+    request = dijkstra.build_arp(arp.ARP_REQUEST, '00:00:00:00:00:01', '10.0.0.1', '00:00:00:00:00:00', '10.0.0.2')
+
+    # a copy flooded by the neighbour is dropped
+    packet_in(ctl, dp1, 2, request)
+    assert dp1.sent == []
+
+    # the host now on port 4 gets the answer there
+    packet_in(ctl, dp1, 4, request)
+    assert ctl.hosts['00:00:00:00:00:01'] == (1, 4)
+    reply = dp1.messages('OFPPacketOut')[0]
+    assert [action.port for action in reply.actions] == [4]
@@ -0,0 +1,99 @@
+#The binary snapshots must give back the state they saved, and the controller
+#must rebuild its indexes from them (run with python -m pytest tests).
+
+from ryu.ofproto import ofproto_v1_3
+
+import dijkstra
+import snapshot
+
+from helpers import make_controller
+
+SELECT = ofproto_v1_3.OFPGT_SELECT
+FF = ofproto_v1_3.OFPGT_FF
+HOSTS = {'00:00:00:00:00:01': (1, 1), '00:00:00:00:00:02': (3, 1)}
+ARP = {'10.0.0.1': ('00:00:00:00:00:01', 100.5), '10.0.0.2': ('00:00:00:00:00:02', 200.25)}
+LINKS = [(1, 2, 2), (2, 1, 1), (2, 3, 3), (3, 2, 2)]
+PATHS = {('10.0.0.1', '10.0.0.2'): 1, ('10.0.0.2', '10.0.0.1'): 2}
+FLOWS = {
+    (1, '10.0.0.1', '10.0.0.2'): ((2,), 1),
+    (2, '10.0.0.1', '10.0.0.2'): ((SELECT, 1, 3, ((3, 10), (4, 5))), 1),
+    (3, '10.0.0.1', '10.0.0.2'): ((1,), 1),
+    (3, '10.0.0.2', '10.0.0.1'): ((2,), 2),
+    (2, '10.0.0.2', '10.0.0.1'): ((FF, 3, 1, ((1, 0), (5, 0))), 2),
+    (1, '10.0.0.2', '10.0.0.1'): ((1,), 2),
+}
+GROUPS = {(2, SELECT, 1, 3): 7, (2, FF, 3, 1): 3}
+DESTINATIONS = {'10.0.0.2': 3, ('10.0.0.0', '255.255.255.0'): 5}
+NEXT_COOKIE = 6
+
+
+def save(path):
+    snapshot.save(path, HOSTS, ARP, LINKS, PATHS, FLOWS, GROUPS, DESTINATIONS, NEXT_COOKIE)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    save(path)
+    state = snapshot.load(path)
+    assert state['hosts'] == HOSTS
+    assert state['arp'] == ARP
+    assert state['links'] == LINKS
+    assert state['paths'] == PATHS
+    assert state['flows'] == FLOWS
+    assert state['groups'] == GROUPS
+    assert state['destinations'] == DESTINATIONS
+    assert state['next_cookie'] == NEXT_COOKIE
+
+
+def test_invalid_files(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    assert snapshot.load(path) is None
+    save(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    for broken in (data[:-1], data + b'\0', data[:snapshot.HEADER.size - 1], b'RYUSNAP0' + data[8:]):
+        with open(path, 'wb') as f:
+            f.write(broken)
+        assert snapshot.load(path) is None
+
+
+def test_restore(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    save(path)
+    ctl = make_controller({})
+    ctl.restore_snapshot(path)
+
+    assert ctl.hosts == HOSTS
+    assert ctl.arp_table == dict((ip, mac) for ip, (mac, seen) in ARP.items())
+    assert ctl.adjacency[1][2] == 2 and ctl.adjacency[3][2] == 2
+    assert ctl.restored_links == set([(1, 2), (2, 1), (2, 3), (3, 2)])
+    assert ctl.flow_registry == FLOWS
+    assert ctl.groups == {(2, SELECT, 1, 3): [7, 1, ((3, 10), (4, 5))], (2, FF, 3, 1): [3, 1, ((1, 0), (5, 0))]}
+    assert ctl.group_free[2] == [6, 5, 4, 2, 1]
+    assert ctl.cookie_paths[1] == ('10.0.0.1', '10.0.0.2', set([1, 2, 3]), set([(1, 2), (2, 3)]))
+    assert ctl.cookie_paths[2] == ('10.0.0.2', '10.0.0.1', set([1, 2, 3]), set([(1, 2), (2, 3)]))
+    assert ctl.installed_pairs[1, 3] == set([('10.0.0.1', '10.0.0.2')])
+    assert ctl.destination_cookies == DESTINATIONS
+    assert ctl.cookie_destinations == {3: '10.0.0.2', 5: ('10.0.0.0', '255.255.255.0')}
+
+    # the cookies allocated after the restart do not reuse the ones of the destination rules
+    assert ctl.next_cookie == NEXT_COOKIE
+    assert ctl.index_path('10.0.0.1', '10.0.0.3', [(1, [(2, 1.0)])], {}) == NEXT_COOKIE
+
+
+def test_restored_links_of_switches_which_never_reconnect(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    save(path)
+    ctl = make_controller({})
+    ctl.restore_snapshot(path)
+
+    ctl.expire_restored_links(ctl.restored_at + 1)
+    assert len(ctl.restored_links) == 4
+
+    # no switch came back: the links, and the paths crossing them, are removed
+    ctl.expire_restored_links(ctl.restored_at + dijkstra.restored_link_timeout + 1)
+    assert ctl.restored_links == set()
+    assert ctl.adjacency[1].get(2) is None and ctl.adjacency[2].get(3) is None
+    assert ctl.cookie_paths == {}
+    assert ctl.flow_registry == {}
+    assert ctl.groups == {}
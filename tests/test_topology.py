@@ -0,0 +1,13 @@
+#The generated descriptions have no parallel links (run with python -m pytest tests).
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import topology
+
+
+def test_ring_has_no_parallel_links():
+    for switches in (2, 3, 8):
+        links = [tuple(sorted(link[:2])) for link in topology.ring(switches)['links']]
+        assert len(links) == len(set(links)) == (1 if switches == 2 else switches)
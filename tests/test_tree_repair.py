@@ -0,0 +1,118 @@
+#The shortest path trees repaired on link events must stay equal to the trees
+#computed from scratch (run with python -m pytest tests).
+
+import random
+
+from helpers import make_controller, add_link, remove_link
+
+
+def check_trees(ctl):
+    for src, (distance, previous) in ctl.trees.items():
+        fresh = ctl.shortest_path_tree(src)[0]
+        assert set(distance) == set(fresh), src
+        for node, d in fresh.items():
+            assert abs(distance[node] - d) < 1e-9, (src, node, distance[node], d)
+            # the tree route really has the distance of the node
+            path = ctl.path_from_tree(previous, src, node)
+            cost = sum(ctl.get_link_cost(a, b) for a, b in zip(path, path[1:]))
+            assert abs(cost - d) < 1e-9, (src, node, path)
+
+
+def tree_routes(ctl): #route of every pair of the trees, to find the ones a link event changed
+    routes = {}
+    for src, (distance, previous) in ctl.trees.items():
+        for node in distance:
+            routes[src, node] = ctl.path_from_tree(previous, src, node)
+    return routes
+
+
+def test_cheaper_tree_link():
+    ctl = make_controller({(1, 2): 1, (2, 3): 4, (1, 4): 3, (4, 5): 2, (3, 5): 1})
+    assert ctl.get_path(1, 5) == [1, 4, 5]
+    ctl.link_table[2, 3] = (1, 10)
+    # s3 gets closer through the same route, only the route of s5 changes
+    assert ctl.link_changed(2, 3) == set([(1, 5)])
+    assert ctl.get_path(1, 5) == [1, 2, 3, 5]
+    check_trees(ctl)
+
+
+def test_cheaper_link_without_new_route():
+    ctl = make_controller({(1, 2): 1, (2, 3): 4, (1, 4): 3, (4, 5): 2, (3, 5): 1})
+    assert ctl.get_path(1, 5) == [1, 4, 5]
+    ctl.link_table[1, 4] = (2, 10)
+    assert ctl.link_changed(1, 4) == set()
+    check_trees(ctl)
+
+
+def test_random_link_events():
+    rng = random.Random(1)
+    n = 12
+    links = {}
+    for v in range(2, n + 1):
+        links[rng.randint(1, v - 1), v] = rng.randint(1, 10)
+    while len(links) < 2 * n:
+        u, v = sorted(rng.sample(range(1, n + 1), 2))
+        links[u, v] = rng.randint(1, 10)
+    ctl = make_controller(links)
+    for src in range(1, n + 1):
+        ctl.trees[src] = ctl.shortest_path_tree(src)
+
+    present = set(links)
+    for step in range(300):
+        u, v = sorted(rng.sample(range(1, n + 1), 2))
+        before = tree_routes(ctl)
+        worse = False
+        if (u, v) in present and rng.random() < 0.2:
+            present.discard((u, v))
+            remove_link(ctl, u, v)
+            worse = True
+        else:
+            w = rng.choice([rng.randint(1, 10), rng.uniform(0.1, 2)])
+            worse = (u, v) in present and w > ctl.get_link_cost(u, v)
+            present.add((u, v))
+            add_link(ctl, u, v, w)
+        reported = ctl.link_changed(u, v)
+        check_trees(ctl)
+
+        after = tree_routes(ctl)
+        moved = set(pair for pair in set(before) | set(after) if before.get(pair) != after.get(pair))
+        assert moved <= reported, (step, moved - reported)
+        if not worse:
+            # a new or cheaper link reports exactly the routes it changed
+            assert reported == moved, (step, reported - moved)
+
+
+def test_worker_tree_catching_up():
+    ctl = make_controller({(1, 2): 1, (2, 3): 4, (1, 4): 3, (4, 5): 2, (3, 5): 1})
+    tree = ctl.shortest_path_tree(1) #computed by a worker while the link cost changes
+    ctl.link_table[2, 3] = (1, 10)
+    assert not ctl.tree_exact(tree)
+    assert ctl.catch_up_tree(tree, [(2, 3)])
+    ctl.trees[1] = tree
+    check_trees(ctl)
+
+
+def test_worker_tree_missing_several_events():
+    rng = random.Random(2)
+    n = 12
+    links = {}
+    for v in range(2, n + 1):
+        links[rng.randint(1, v - 1), v] = rng.randint(1, 10)
+    ctl = make_controller(links)
+    present = set(links)
+    for step in range(100):
+        tree = ctl.shortest_path_tree(1)
+        missed = []
+        for _ in range(3):
+            u, v = sorted(rng.sample(range(1, n + 1), 2))
+            if (u, v) in present and rng.random() < 0.3:
+                present.discard((u, v))
+                remove_link(ctl, u, v)
+            else:
+                present.add((u, v))
+                add_link(ctl, u, v, rng.choice([rng.randint(1, 10), rng.uniform(0.1, 2)]))
+            missed.append((u, v))
+        # a tree is only kept once it is a shortest path tree of the current topology
+        if ctl.catch_up_tree(tree, missed):
+            ctl.trees = {1: tree}
+            check_trees(ctl)
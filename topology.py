@@ -0,0 +1,266 @@
+#Parametric Mininet topologies: fat-tree, leaf-spine, ring, full mesh and Waxman
+#random graphs, or a JSON/YAML description file.
+#
+#   sudo python topology.py fat-tree --k 4
+#   sudo python topology.py waxman --switches 30 --hosts-per-switch 2
+#   sudo python topology.py file my_topology.json
+#   python topology.py leaf-spine --leaves 16 --spines 4 --output leaf_spine.json   (writes the description only)
+#
+#A description is a dict which can be saved as JSON or YAML:
+#   {"switches": [1, 2, ...],
+#    "hosts": [{"name": "h1", "switch": 1, "ip": "10.0.0.1", "mac": "00:00:00:00:00:01"}, ...],
+#    "links": [[1, 2, "base_link"], ...],
+#    "profiles": {"base_link": {"bw": 1000, "delay": "4ms"}, ...}}   (optional, LINK_PROFILES by default)
+#The switch s<n> gets the datapath id n.
+
+import argparse, itertools, json, math, random
+
+try:
+    from mininet.net import Mininet
+    from mininet.node import RemoteController
+    from mininet.cli import CLI
+    from mininet.link import TCLink
+    from mininet.log import setLogLevel
+except ImportError: #the descriptions can be generated without Mininet
+    Mininet = None
+
+try:
+    import yaml
+except ImportError: #YAML descriptions are optional
+    yaml = None
+
+# link profiles of the original scripts (used for delay and bandwidth detection on the links)
+LINK_PROFILES = {
+    'hostlink': dict(bw=1000, delay='0ms'), #0 ms for links between hosts and their switches
+    'base_link': dict(bw=1000, delay='4ms'), #4 ms used for low congestion links
+    'mid_link': dict(bw=570, delay='7ms'), #7 ms used for mid congestion links
+    'busy_link': dict(bw=400, delay='10ms'), #10 ms used for high congestion links
+}
+default_link_delay = 4.0 #ms, delay the controllers give to the switch links missing from the description (base_link)
+
+
+def describe(switches, links, host_switches, hosts_per_switch=1): #description with hosts_per_switch hosts on each host switch
+    hosts = []
+    for dpid in host_switches:
+        for _ in range(hosts_per_switch):
+            i = len(hosts) + 1
+            hosts.append({
+                'name': 'h%d' % i,
+                'switch': dpid,
+                'ip': '10.%d.%d.%d' % ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff),
+                'mac': ':'.join('%02x' % b for b in (i >> 40 & 0xff, i >> 32 & 0xff, i >> 24 & 0xff,
+                                                     i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff)),
+            })
+    return {'switches': list(switches), 'hosts': hosts, 'links': [list(link) for link in links]}
+
+
+def fat_tree(k, hosts_per_switch=1, profile='base_link'): #k-ary fat-tree, the hosts are on the edge switches
+    half = k // 2
+    core = list(range(1, half * half + 1))
+    links = []
+    edges = []
+    dpid = len(core)
+    for pod in range(k):
+        aggs = list(range(dpid + 1, dpid + half + 1))
+        pod_edges = list(range(dpid + half + 1, dpid + k + 1))
+        dpid += k
+        for i, agg in enumerate(aggs):
+            for j in range(half):
+                links.append((core[i * half + j], agg, profile))
+            for edge in pod_edges:
+                links.append((agg, edge, profile))
+        edges += pod_edges
+    return describe(range(1, dpid + 1), links, edges, hosts_per_switch)
+
+
+def leaf_spine(leaves, spines, hosts_per_switch=1, profile='base_link'): #every leaf is linked to every spine, the hosts are on the leaves
+    links = []
+    for leaf in range(spines + 1, spines + leaves + 1):
+        for spine in range(1, spines + 1):
+            links.append((spine, leaf, profile))
+    return describe(range(1, spines + leaves + 1), links, range(spines + 1, spines + leaves + 1), hosts_per_switch)
+
+
+def ring(switches, hosts_per_switch=1, profile='base_link'): #the closing link is only added from 3 switches, 2 would get a parallel link
+    links = [(i, i + 1, profile) for i in range(1, switches)]
+    if switches > 2:
+        links.append((switches, 1, profile))
+    return describe(range(1, switches + 1), links, range(1, switches + 1), hosts_per_switch)
+
+
+def mesh(switches, hosts_per_switch=1, profile='base_link'): #every switch is linked to all the others
+    links = [(a, b, profile) for a, b in itertools.combinations(range(1, switches + 1), 2)]
+    return describe(range(1, switches + 1), links, range(1, switches + 1), hosts_per_switch)
+
+
+def waxman(switches, alpha=0.4, beta=0.4, hosts_per_switch=1, seed=1): #Waxman random graph, the profile follows the link length
+    rng = random.Random(seed)
+    position = dict((i, (rng.random(), rng.random())) for i in range(1, switches + 1))
+    def length(a, b):
+        return math.hypot(position[a][0] - position[b][0], position[a][1] - position[b][1])
+    diameter = max([length(a, b) for a, b in itertools.combinations(position, 2)] or [1.0])
+
+    edges = set()
+    for a, b in itertools.combinations(range(1, switches + 1), 2):
+        if rng.random() < beta * math.exp(-length(a, b) / (alpha * diameter)):
+            edges.add((a, b))
+
+    # the components are joined by their closest switches, so that every host can be reached
+    parent = dict((i, i) for i in position)
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for a, b in edges:
+        parent[find(a)] = find(b)
+    while len(set(find(i) for i in position)) > 1:
+        a, b = min(((a, b) for a, b in itertools.combinations(position, 2) if find(a) != find(b)),
+                   key=lambda pair: length(*pair))
+        edges.add((a, b))
+        parent[find(a)] = find(b)
+
+    # short links are fast, long ones are the congested ones
+    links = []
+    for a, b in sorted(edges):
+        ratio = length(a, b) / diameter
+        profile = 'base_link' if ratio < 0.2 else 'mid_link' if ratio < 0.4 else 'busy_link'
+        links.append((a, b, profile))
+    return describe(range(1, switches + 1), links, range(1, switches + 1), hosts_per_switch)
+
+
+def load(path): #description saved as JSON, or as YAML for the .yaml and .yml files
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ImportError('PyYAML is needed to read %s' % path)
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def dump(description, path):
+    with open(path, 'w') as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ImportError('PyYAML is needed to write %s' % path)
+            yaml.safe_dump(description, f, default_flow_style=None)
+        else:
+            # one host or link per line, so that the files stay readable and diff well
+            f.write('{\n')
+            for i, key in enumerate(description):
+                value = description[key]
+                if isinstance(value, list) and value and isinstance(value[0], (dict, list)):
+                    text = '[\n%s\n ]' % ',\n'.join('  ' + json.dumps(item) for item in value)
+                else:
+                    text = json.dumps(value)
+                f.write(' %s: %s%s\n' % (json.dumps(key), text, ',' if i < len(description) - 1 else ''))
+            f.write('}\n')
+
+
+def get_profiles(description): #link profiles of the description, LINK_PROFILES for the ones it does not define
+    profiles = dict(LINK_PROFILES)
+    profiles.update(description.get('profiles', {}))
+    return profiles
+
+
+def parse_delay(delay): #milliseconds of a Mininet delay such as '4ms', '500us' or '1s'
+    delay = str(delay).strip()
+    for unit, scale in (('us', 0.001), ('ms', 1.0), ('s', 1000.0)):
+        if delay.endswith(unit):
+            return float(delay[:-len(unit)]) * scale
+    return float(delay)
+
+
+def link_table(description): #(s1, s2) with s1 < s2 -> (delay in ms, bandwidth in Mbit/s) of the switch links
+    profiles = get_profiles(description)
+    table = {}
+    for a, b, profile in description['links']:
+        options = profiles[profile]
+        table[(a, b) if a < b else (b, a)] = (parse_delay(options.get('delay', '0ms')), options.get('bw'))
+    return table
+
+
+def link_delay(table, s1, s2): #delay in ms of the link s1-s2 in a link table, default_link_delay if it is not described
+    described = table.get((s1, s2) if s1 < s2 else (s2, s1))
+    if described is None:
+        return default_link_delay
+    return described[0]
+
+
+def link_options(description, profile): #Mininet options of a link profile
+    return dict(get_profiles(description)[profile], cls=TCLink)
+
+
+def build_network(description, controller_ip='127.0.0.1', controller_port=6633): #Mininet network of the description
+    # defining net
+    net = Mininet(controller=RemoteController, link=TCLink)
+
+    # adding switches, the datapath id is the number of the switch
+    switches = {}
+    for dpid in description['switches']:
+        switches[dpid] = net.addSwitch('s%d' % dpid, dpid='%016x' % dpid)
+
+    # adding hosts and the links towards their switches
+    for host in description['hosts']:
+        h = net.addHost(host['name'], ip=host['ip'], mac=host['mac'])
+        net.addLink(h, switches[host['switch']], **link_options(description, 'hostlink'))
+
+    # adding controller with IP address and port
+    net.addController('C0', controller=RemoteController, ip=controller_ip, port=controller_port)
+
+    # adding the links between switches
+    for a, b, profile in description['links']:
+        net.addLink(switches[a], switches[b], **link_options(description, profile))
+    return net
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parametric Mininet topologies for the Ryu controllers.')
+    parser.add_argument('kind', choices=['fat-tree', 'leaf-spine', 'ring', 'mesh', 'waxman', 'file'])
+    parser.add_argument('path', nargs='?', help='description file of the file topology')
+    parser.add_argument('--k', type=int, default=4, help='ports of the fat-tree switches')
+    parser.add_argument('--leaves', type=int, default=4)
+    parser.add_argument('--spines', type=int, default=2)
+    parser.add_argument('--switches', type=int, default=8, help='switches of the ring, mesh and Waxman topologies')
+    parser.add_argument('--alpha', type=float, default=0.4, help='Waxman alpha, weight of the long links')
+    parser.add_argument('--beta', type=float, default=0.4, help='Waxman beta, link density')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--hosts-per-switch', type=int, default=1)
+    parser.add_argument('--controller-ip', default='127.0.0.1')
+    parser.add_argument('--controller-port', type=int, default=6633)
+    parser.add_argument('--output', help='writes the description to this JSON/YAML file instead of starting Mininet')
+    args = parser.parse_args()
+
+    if args.kind == 'file':
+        if args.path is None:
+            parser.error('the file topology needs the path of its description')
+        description = load(args.path)
+    elif args.kind == 'fat-tree':
+        description = fat_tree(args.k, args.hosts_per_switch)
+    elif args.kind == 'leaf-spine':
+        description = leaf_spine(args.leaves, args.spines, args.hosts_per_switch)
+    elif args.kind == 'ring':
+        description = ring(args.switches, args.hosts_per_switch)
+    elif args.kind == 'mesh':
+        description = mesh(args.switches, args.hosts_per_switch)
+    else:
+        description = waxman(args.switches, args.alpha, args.beta, args.hosts_per_switch, args.seed)
+
+    if args.output:
+        dump(description, args.output)
+        return
+    if Mininet is None:
+        parser.error('Mininet is not installed, only --output can be used')
+
+    setLogLevel('info')
+    net = build_network(description, args.controller_ip, args.controller_port)
+    # running network
+    net.start()
+    # starting cli
+    CLI(net)
+    # stopping network
+    net.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#Process pool computing the shortest paths of the dijkstra.py controller out of the
+#eventlet hub: the handlers of all the switches (echo replies, LLDP, packet-ins) keep
+#running while the paths of a large topology are computed.
+#
+#The workers receive a snapshot of the topology with every task and keep no state
+#(the snapshot is pickled once per topology version by the controller),
+#the results are plain dicts and arrays which the controller checks against its
+#current topology before using them.
+
+from ryu.lib import hub
+
+from concurrent.futures import ProcessPoolExecutor
+
+import heapq, pickle
+
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+except ImportError: #the all-pairs matrix needs NumPy and SciPy
+    csgraph_dijkstra = None
+
+poll_interval = 0.001 #seconds between two checks of the results by the waiting greenthread
+
+
+def shortest_path_tree(neighbours, src): #Dijkstra from src, neighbours(u) yields the (neighbour, link cost) pairs of u
+    # defining dictionaries for saving each node's distance and its previous node in the path from first node to that node
+    # (nodes missing from distance are still at infinity)
+    distance = {src: 0}
+    previous = {src: None}
+    settled = set()
+
+    # binary heap of (distance, node) entries; outdated entries are skipped when popped (lazy deletion)
+    heap = [(0, src)]
+
+    while heap:
+        # getting the closest node to src among undiscovered nodes
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        # calculate minimum distance only for the real neighbours of u
+        for p, w in neighbours(u):
+            # if the path via u to p has lower cost then make the cost equal to this new path's cost
+            if p not in settled and d + w < distance.get(p, float('Inf')):
+                distance[p] = d + w
+                previous[p] = u
+                heapq.heappush(heap, (d + w, p))
+
+    return distance, previous
+
+
+def shortest_path_trees(snapshot, sources): #trees of several sources on a pickled topology snapshot, one task per batch
+    snapshot = pickle.loads(snapshot)
+    neighbours = lambda u: snapshot.get(u, ())
+    return dict((src, shortest_path_tree(neighbours, src)) for src in sources)
+
+
+def all_pairs_predecessors(n, rows, cols, weights, old=None): #predecessor matrix of the weights in COO form, and the routes changed since old
+    graph = csr_matrix((weights, (rows, cols)), shape=(n, n))
+    predecessors = csgraph_dijkstra(graph, directed=True, return_predecessors=True)[1]
+    if old is None:
+        return predecessors, None
+    return predecessors, changed_routes(old, predecessors)
+
+
+def changed_routes(old, predecessors): #(sources, destinations) index arrays of the routes which differ between the matrices
+    # a route changes when its predecessor changes or when the route
+    # towards the predecessor changes, propagated down the new trees
+    changed = old != predecessors
+    reachable = predecessors >= 0
+    sources = np.nonzero(reachable)[0]
+    parents = predecessors[reachable]
+    while True:
+        propagated = changed.copy()
+        propagated[reachable] |= changed[sources, parents]
+        if (propagated == changed).all():
+            break
+        changed = propagated
+    return np.nonzero(changed)
+
+
+class PathWorkers(object): #the calls block the calling greenthread only, never the hub
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.pool = ProcessPoolExecutor(processes)
+
+    def call(self, fn, *args):
+        return self.wait([self.pool.submit(fn, *args)])[0]
+
+    def map_batches(self, fn, neighbours, items): #fn(neighbours, batch) on one batch of items per process, results merged
+        items = list(items)
+        size = max(1, -(-len(items) // self.processes))
+        futures = [self.pool.submit(fn, neighbours, items[i:i + size]) for i in range(0, len(items), size)]
+        results = {}
+        for result in self.wait(futures):
+            results.update(result)
+        return results
+
+    def wait(self, futures):
+        while not all(future.done() for future in futures):
+            hub.sleep(poll_interval)
+        return [future.result() for future in futures]
+
+    def shutdown(self): #the queued tasks are cancelled, the running ones finish
+        self.pool.shutdown(wait=True, cancel_futures=True)